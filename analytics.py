@@ -0,0 +1,128 @@
+import numpy as np
+
+from models import db, Tour, Score, HoleResult
+from queries import filter_rounds
+
+PAR_TYPES = (3, 4, 5)
+MAX_PUTTS = 4
+
+
+def _mean(values):
+    """Return the mean of the non-NaN values as a float, or None if there are none."""
+    values = values[~np.isnan(values)]
+    return round(float(values.mean()), 2) if values.size else None
+
+
+class HoleMatrix:
+    """Hole data of many cards stored as (cards x 18) float arrays, NaN when missing."""
+
+    def __init__(self, par, strokes, putts, gir, hcps):
+        self.par = par
+        self.strokes = strokes
+        self.putts = putts
+        self.gir = gir
+        self.hcps = hcps
+
+    @property
+    def cards(self):
+        return self.par.shape[0]
+
+    @classmethod
+    def load(cls, **filters):
+        """Read the holes of the filtered cards with two queries."""
+        query = (
+            db.session.query(HoleResult.score_id, HoleResult.hole_no, HoleResult.par,
+                             HoleResult.strokes, HoleResult.putts, HoleResult.gir)
+            .join(Score, HoleResult.score_id == Score.id)
+            .join(Tour, Score.tour_id == Tour.id)
+        )
+        rows = filter_rounds(query, **filters).all()
+        rows = np.array([tuple(row) for row in rows], dtype=float).reshape(-1, 6)
+        score_ids, card_idx = np.unique(rows[:, 0], return_inverse=True)
+        hole_idx = rows[:, 1].astype(int) - 1
+        shape = (len(score_ids), 18)
+        columns = []
+        for col in range(2, 6):
+            matrix = np.full(shape, np.nan)
+            matrix[card_idx, hole_idx] = rows[:, col]
+            columns.append(matrix)
+        hcps = np.full(shape, np.nan)
+        if len(score_ids):
+            tour_hcps = dict(filter_rounds(
+                db.session.query(Score.id, Tour.hcps).join(Tour, Score.tour_id == Tour.id), **filters
+            ))
+            for i, score_id in enumerate(score_ids.astype(int).tolist()):
+                card_hcps = tour_hcps.get(score_id)
+                if card_hcps and len(card_hcps) == 18:
+                    hcps[i] = [h if h is not None else np.nan for h in card_hcps]
+        return cls(*columns, hcps)
+
+    @classmethod
+    def from_cards(cls, cards):
+        """Build the matrix from a list of cards, each a dict with `holes` and `hcps`."""
+        def matrix(key):
+            return np.array([[h.get(key) for h in c['holes']] for c in cards], dtype=float).reshape(-1, 18)
+        hcps = np.array([c['hcps'] for c in cards], dtype=float).reshape(-1, 18)
+        return cls(matrix('par'), matrix('strokes'), matrix('putts'), matrix('gir'), hcps)
+
+    def over_par(self):
+        return self.strokes - self.par
+
+    def by_hole(self):
+        """Average strokes over par and putts per hole number."""
+        over = self.over_par()
+        return [
+            {'hole_no': i + 1, 'over_par': _mean(over[:, i]), 'putts': _mean(self.putts[:, i])}
+            for i in range(18)
+        ]
+
+    def by_par(self):
+        """Average strokes over par on par 3, 4 and 5 holes."""
+        over = self.over_par()
+        return [
+            {'par': par, 'holes': int((self.par == par).sum()), 'over_par': _mean(over[self.par == par])}
+            for par in PAR_TYPES
+        ]
+
+    def putts_distribution(self):
+        """Share of holes played with 0, 1, 2, 3 and 4 or more putts."""
+        putts = self.putts[~np.isnan(self.putts)].astype(int)
+        counts = np.bincount(np.minimum(putts, MAX_PUTTS), minlength=MAX_PUTTS + 1)
+        total = counts.sum()
+        return [
+            {'putts': n, 'holes': int(count), 'pct': round(float(count / total * 100), 1) if total else 0.0}
+            for n, count in enumerate(counts)
+        ]
+
+    def gir_vs_score(self):
+        """Average strokes over par and putts with and without a green in regulation."""
+        over = self.over_par()
+        played = ~np.isnan(self.gir)
+        result = []
+        for gir in (True, False):
+            mask = played & (self.gir == gir)
+            result.append({
+                'gir': gir,
+                'holes': int(mask.sum()),
+                'over_par': _mean(over[mask]),
+                'putts': _mean(self.putts[mask]),
+            })
+        return result
+
+    def by_stroke_index(self):
+        """Average strokes over par per hole stroke index (1 = hardest)."""
+        over = self.over_par()
+        return [
+            {'hcp': hcp, 'over_par': _mean(over[self.hcps == hcp])}
+            for hcp in range(1, 19)
+        ]
+
+    def summary(self):
+        return {
+            'cards': self.cards,
+            'by_hole': self.by_hole(),
+            'by_par': self.by_par(),
+            'putts_distribution': self.putts_distribution(),
+            'gir_vs_score': self.gir_vs_score(),
+            'by_stroke_index': self.by_stroke_index(),
+        }
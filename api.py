@@ -0,0 +1,229 @@
+"""Versioned JSON API over golfs, tours, scores and stats.
+
+Lists are paged with the same keyset cursors as the HTML pages and accept
+`fields=` to return only some fields, so list calls can skip the 18 holes.
+Responses are compressed with Brotli when the brotli package is installed
+and the client accepts it, gzip otherwise. The API uses the login session
+but no CSRF token: writes must send a JSON body, which a cross-site form
+cannot do.
+"""
+import gzip
+from datetime import date
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from cache import bump_version
+from catalog import Course, course_catalog
+from jobs import active_jobs, enqueue_recompute, job_runner
+from models import db, Golf, Tour, HoleResult
+import importer
+import queries
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+GOLF_FIELDS = Course._fields
+TOUR_COLUMNS = ('id', 'name', 'jour', 'date', 'golf_id', 'par', 'slope', 'sss', 'pcc', 'pars', 'hcps')
+SCORE_COLUMNS = ('handicap', 'total_strokes', 'total_sba', 'diff')
+STATS_COLUMNS = ('fairway_hits', 'fairway_possible', 'gir_hits', 'putts_total', 'putts_avg')
+TOUR_FIELDS = TOUR_COLUMNS + SCORE_COLUMNS + ('stats', 'holes')
+JOB_FIELDS = ('id', 'kind', 'target_id', 'status', 'done', 'total')
+
+
+def selected_fields(available):
+    """Return the fields asked with `fields=`, or every field."""
+    value = request.args.get('fields')
+    if not value:
+        return available
+    fields = tuple(name.strip() for name in value.split(',') if name.strip())
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise BadRequest(f'champs inconnus : {", ".join(unknown)}')
+    return fields
+
+
+def page_size():
+    size = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    return max(1, min(size, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def json_body():
+    """Return the JSON request body; other content types are refused with 415."""
+    return request.get_json()
+
+
+def golf_resource(course, fields):
+    return {name: getattr(course, name) for name in fields}
+
+
+def tour_resource(tour, fields):
+    """Return the requested fields of a tour and of its score, holes and stats."""
+    score = tour.score
+    values = {}
+    for name in fields:
+        if name in TOUR_COLUMNS:
+            value = getattr(tour, name)
+            values[name] = value.isoformat() if isinstance(value, date) else value
+        elif name in SCORE_COLUMNS:
+            values[name] = getattr(score, name) if score else None
+        elif name == 'stats':
+            stats = score.stats if score else None
+            values[name] = {key: getattr(stats, key) for key in STATS_COLUMNS} if stats else None
+        elif name == 'holes':
+            values[name] = [
+                {key: getattr(hole, key) for key in HoleResult.FIELDS} for hole in score.holes
+            ] if score else None
+    return values
+
+
+def golf_values(data):
+    """Validate a golf body and return its column values."""
+    if not isinstance(data, dict):
+        raise BadRequest('objet JSON attendu')
+    values = {}
+    try:
+        for name in ('name', 'course', 'tees'):
+            values[name] = str(data[name])
+        values['par'] = int(data['par'])
+        values['slope'] = int(data['slope'])
+        values['sss'] = float(data['sss'])
+    except KeyError as exc:
+        raise BadRequest(f'{exc.args[0]} manquant') from None
+    except (TypeError, ValueError):
+        raise BadRequest('par, slope et sss doivent être des nombres') from None
+    for name in ('pars', 'hcps'):
+        holes = data.get(name)
+        if holes is not None and (not isinstance(holes, list) or len(holes) != 18
+                                  or not all(isinstance(v, int) for v in holes)):
+            raise BadRequest(f'{name} doit contenir 18 entiers')
+        values[name] = holes
+    return values
+
+
+@api.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        response = jsonify(error='authentification requise')
+        response.status_code = 401
+        return response
+
+
+@api.errorhandler(HTTPException)
+def json_error(exc):
+    response = jsonify(error=exc.description)
+    response.status_code = exc.code
+    return response
+
+
+@api.after_request
+def compress(response):
+    """Add a weak ETag, answer 304 when it matches, then compress large bodies."""
+    if request.method != 'GET' or response.direct_passthrough or response.status_code != 200:
+        return response
+    response.vary.add('Accept-Encoding')
+    response.add_etag(weak=True)
+    response.make_conditional(request)
+    data = response.get_data()
+    if response.status_code != 200 or len(data) < current_app.config['API_COMPRESS_MIN_SIZE']:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] and accepted['br'] >= accepted['gzip']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.content_encoding = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.content_encoding = 'gzip'
+    return response
+
+
+@api.route('/golfs')
+def list_golfs():
+    fields = selected_fields(GOLF_FIELDS)
+    return jsonify(golfs=[golf_resource(c, fields) for c in course_catalog().courses])
+
+
+@api.route('/golfs/<int:golf_id>')
+def get_golf(golf_id):
+    course = course_catalog().by_id.get(golf_id)
+    if not course:
+        raise NotFound('golf inconnu')
+    return jsonify(golf_resource(course, selected_fields(GOLF_FIELDS)))
+
+
+@api.route('/golfs', methods=['POST'])
+@api.route('/golfs/<int:golf_id>', methods=['PUT'])
+def save_golf(golf_id=None):
+    values = golf_values(json_body())
+    golf = db.session.get(Golf, golf_id) if golf_id else Golf()
+    if not golf:
+        raise NotFound('golf inconnu')
+    old_layout = {'pars': golf.pars, 'hcps': golf.hcps}
+    for name, value in values.items():
+        setattr(golf, name, value)
+    db.session.add(golf)
+    relayout = golf_id and (old_layout['pars'] != golf.pars or old_layout['hcps'] != golf.hcps)
+    if relayout:
+        enqueue_recompute('golf', golf.id, current_user.id, old_layout)
+    bump_version()
+    db.session.commit()
+    if relayout:
+        job_runner.wake()
+    response = jsonify(golf_resource(course_catalog().by_id[golf.id], GOLF_FIELDS))
+    response.status_code = 200 if golf_id else 201
+    return response
+
+
+@api.route('/tours')
+def list_tours():
+    fields = selected_fields(TOUR_FIELDS)
+    page, next_cursor = queries.tours_page(
+        current_user.id, request.args.get('cursor'), page_size(),
+        holes='holes' in fields, stats='stats' in fields,
+    )
+    return jsonify(tours=[tour_resource(t, fields) for t in page], next_cursor=next_cursor)
+
+
+@api.route('/tours/<int:tour_id>')
+def get_tour(tour_id):
+    fields = selected_fields(TOUR_FIELDS)
+    tour = (Tour.query.filter_by(id=tour_id, user_id=current_user.id)
+            .options(*queries.tour_loads(holes='holes' in fields, stats='stats' in fields))
+            .first())
+    if not tour:
+        raise NotFound('tour inconnu')
+    return jsonify(tour_resource(tour, fields))
+
+
+@api.route('/jobs')
+def list_jobs():
+    """Progress of the rescoring jobs started by the user's edits."""
+    return jsonify(jobs=[{name: getattr(job, name) for name in JOB_FIELDS} for job in active_jobs(current_user.id)])
+
+
+@api.route('/cards', methods=['POST'])
+def create_cards():
+    """Create several completed cards, scored like the score entry form.
+
+    The body is a list of cards (or {"cards": [...]}) in the JSON import
+    format; invalid cards are reported by their position and skipped.
+    """
+    data = json_body()
+    cards = data.get('cards') if isinstance(data, dict) else data
+    if not isinstance(cards, list) or not cards:
+        raise BadRequest('liste de cartes attendue')
+    if len(cards) > current_app.config['API_MAX_BATCH']:
+        raise BadRequest(f'{current_app.config["API_MAX_BATCH"]} cartes au plus par requête')
+    report = importer.import_cards(enumerate(cards), current_user.id)
+    response = jsonify(
+        imported=report.imported,
+        tour_ids=report.tour_ids,
+        errors=[{'index': index, 'error': message} for index, message in report.errors],
+    )
+    response.status_code = 201 if report.imported else 422
+    return response
@@ -1,21 +1,62 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file
+from flask import (Blueprint, Flask, Response, abort, current_app, jsonify, render_template, request,
+                   redirect, stream_with_context, url_for)
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf import CSRFProtect
-import csv
-import os
+from urllib.parse import urlencode
+from werkzeug.http import is_resource_modified
+import click
+import datetime
+import hashlib
+import io
+import time
 
 from config import Config
-from models import db, User, Golf, Tour, Score, Stats
+from models import db, User, Golf, Tour, Score, Stats, IndexHistory, CourseSummary
 from forms import LoginForm, GolfForm, TourForm
-
-app = Flask(__name__)
-app.config.from_object(Config)
+from analytics import HoleMatrix
+from api import api
+import archive
+from cache import bump_version, data_version, view_cache
+from catalog import CATALOG_SCOPE, course_catalog
+from instrumentation import instrumentation
+from jobs import active_jobs, enqueue_recompute, job_runner, run_pending
+from database import setup_sqlite
+from migrations import assign_orphan_tours, migrate_from_tinydb, tinydb_pending, upgrade_database
+from search import search_courses, search_tours
+from summaries import course_summaries, course_summary, refresh_course_summaries
+import export
+import importer
+import queries
+from scoring import card_stats, score_holes, update_score_totals
+from handicap import best_score_ids, current_index, earliest, recent_rounds, update_index_history
 
 # Extensions
-db.init_app(app)
-csrf = CSRFProtect(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+csrf = CSRFProtect()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+
+main = Blueprint('main', __name__, cli_group=None)
+
+
+def create_app(config=Config):
+    """Create the application with the given configuration class."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if not app.config.get('SECRET_KEY'):
+        raise RuntimeError('SECRET_KEY doit être défini')
+    # Before the database, so JSON columns use the timed deserializer.
+    instrumentation.init_app(app)
+    db.init_app(app)
+    setup_sqlite(app)
+    csrf.init_app(app)
+    login_manager.init_app(app)
+    view_cache.init_app(app)
+    job_runner.init_app(app)
+    app.register_blueprint(main)
+    # JSON only: the API refuses form posts instead of checking a CSRF token.
+    csrf.exempt(api)
+    app.register_blueprint(api)
+    return app
 
 
 @login_manager.user_loader
@@ -23,62 +64,187 @@ def load_user(user_id):
     return db.session.get(User, int(user_id))
 
 
-def migrate_from_tinydb():
-    """Import data from TinyDB if the new database is empty."""
-    from tinydb import TinyDB
-
-    db_path = os.path.join(os.path.dirname(__file__), 'db.json')
-    if not os.path.exists(db_path) or Tour.query.first():
-        return
-
-    tdb = TinyDB(db_path)
-    for g in tdb.table('golfs').all():
-        golf = Golf(id=g.doc_id, name=g.get('name'), course=g.get('course'), par=g.get('par'),
-                    slope=g.get('slope'), sss=g.get('sss'), tees=g.get('tees'),
-                    pars=g.get('pars'), hcps=g.get('hcps'))
-        db.session.merge(golf)
-    for t in tdb.table('tours').all():
-        tour = Tour(id=t.doc_id, name=t.get('name'), jour=t.get('jour'), date=t.get('date'),
-                    golf_id=t.get('golf_id'), par=t.get('par'), slope=t.get('slope'),
-                    sss=t.get('sss'), pcc=t.get('pcc', 0), pars=t.get('pars'), hcps=t.get('hcps'))
-        db.session.merge(tour)
-    for s in tdb.table('scores').all():
-        score = Score(id=s.doc_id, tour_id=s.get('tour_id'), handicap=s.get('handicap'), holes=s.get('holes'))
-        db.session.merge(score)
-    for st in tdb.table('stats').all():
-        stats = Stats(id=st.doc_id, score_id=st.get('score_id'), tour_id=st.get('tour_id'),
-                      fairway_hits=st.get('fairway_hits'), fairway_possible=st.get('fairway_possible'),
-                      gir_hits=st.get('gir_hits'), putts_total=st.get('putts_total'), putts_avg=st.get('putts_avg'))
-        db.session.merge(stats)
-    db.session.commit()
-
-
-# Utility functions
-
-def distribute_handicap(handicap, hcps):
-    if handicap is None:
-        handicap = 0
-    base = handicap // 18
-    extra = handicap % 18
-    dist = [base] * 18
-    for i, h in enumerate(hcps):
-        if h <= extra:
-            dist[i] += 1
-    return dist
-
-
-def diff_whs(sba_total, slope, sss, pcc=0):
-    import math
-    diff = (113 / slope) * (sba_total - sss) - pcc
-    base = math.floor(diff * 10)
-    rounded = base / 10
-    centieme = int(abs(diff) * 100) % 10
-    if centieme > 5:
-        rounded += 0.1
-    return round(rounded, 1)
-
-
-@app.route('/login', methods=['GET', 'POST'])
+@main.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create missing tables and columns and backfill score totals."""
+    updated = upgrade_database()
+    print(f'{updated} cartes mises à jour')
+    if tinydb_pending():
+        print('Un fichier db.json est présent : importez-le avec flask --app app migrate-tinydb')
+
+
+@main.cli.command('migrate-tinydb')
+@click.argument('path', required=False, type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=1000, help='Documents écrits par transaction.')
+def migrate_tinydb_command(path, chunk_size):
+    """Import the data of the TinyDB version (db.json), resuming an interrupted import."""
+    start = time.perf_counter()
+
+    def progress(table, done):
+        elapsed = time.perf_counter() - start
+        print(f'{table} : {done} documents ({done / elapsed:.0f}/s)')
+
+    written = migrate_from_tinydb(path, chunk_size, progress)
+    elapsed = time.perf_counter() - start
+    print(f'{written} documents importés en {elapsed:.1f}s ({written / elapsed:.0f}/s)')
+    orphans = Tour.query.filter(Tour.user_id.is_(None)).count()
+    if orphans:
+        print(f'{orphans} tours sans propriétaire : attribuez-les avec flask --app app assign-tours <username>')
+
+
+@main.cli.command('archive-seasons')
+@click.option('--before', type=int, help='Première saison gardée dans les tables courantes.')
+@click.option('--chunk-size', default=500, help='Tours déplacés par transaction.')
+def archive_seasons_command(before, chunk_size):
+    """Move the rounds of old seasons to the archive file, keeping their summaries."""
+    if before is None:
+        before = datetime.date.today().year - current_app.config['ARCHIVE_KEEP_SEASONS'] + 1
+    try:
+        path = archive.open_archive()
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+
+    def progress(moved):
+        print(f'{moved} tours archivés')
+
+    moved = archive.archive_rounds(datetime.date(before, 1, 1), chunk_size, progress)
+    print(f'{moved} tours joués avant {before} archivés dans {path}')
+
+
+@main.cli.command('assign-tours')
+@click.argument('username')
+def assign_tours_command(username):
+    """Give the tours without an owner, such as TinyDB imports, to a user."""
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'Utilisateur inconnu : {username}')
+    print(f'{assign_orphan_tours(user.id)} tours attribués à {username}')
+
+
+@main.cli.command('import-cards')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help="Propriétaire des cartes importées.")
+def import_cards_command(path, username):
+    """Import tours and hole-by-hole scores from a CSV or JSON file."""
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'Utilisateur inconnu : {username}')
+    start = time.perf_counter()
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = importer.import_cards(importer.read_cards(f, importer.detect_format(path)), user.id)
+    elapsed = time.perf_counter() - start
+    print(f'{report.imported} cartes importées en {elapsed:.1f}s')
+    for row_no, message in report.errors:
+        print(f'ligne {row_no} : {message}')
+    if report.file_error:
+        raise click.ClickException(f'Import interrompu : {report.file_error}')
+
+
+@main.cli.command('recompute-worker')
+@click.option('--once', is_flag=True, help="Traiter les travaux en attente puis s'arrêter.")
+@click.option('--interval', default=2.0, help='Secondes entre deux recherches de travaux.')
+def recompute_worker_command(once, interval):
+    """Rescore the cards of queued tour and golf edits."""
+    batch_size = current_app.config['JOB_BATCH_SIZE']
+    stale_after = datetime.timedelta(seconds=current_app.config['JOB_STALE_SECONDS'])
+    while True:
+        ran = run_pending(batch_size, stale_after)
+        if ran:
+            print(f'{ran} recalculs terminés')
+        if once:
+            break
+        time.sleep(interval)
+
+
+def date_arg(name):
+    """Return a date from the query string, or None when it is missing or invalid."""
+    try:
+        return importer.parse_date(request.args.get(name))
+    except ValueError:
+        return None
+
+
+def round_filters():
+    """Return the current user's round filters: golf and date range from the query string.
+
+    `season=YYYY` covers a calendar year; `from` and `to` narrow it further.
+    """
+    date_from, date_to = date_arg('from'), date_arg('to')
+    season = request.args.get('season', type=int)
+    if season and 1900 <= season <= 2100:
+        date_from = max(date_from or datetime.date.min, datetime.date(season, 1, 1))
+        date_to = min(date_to or datetime.date.max, datetime.date(season, 12, 31))
+    return {
+        'user_id': current_user.id,
+        'golf_id': request.args.get('golf', type=int),
+        'date_from': date_from,
+        'date_to': date_to,
+    }
+
+
+def seasons():
+    """Return the seasons the current user has played, latest first."""
+    years = queries.played_years(current_user.id)
+    return list(range(years[1], years[0] - 1, -1)) if years else []
+
+
+def filter_args(filters):
+    """Return the query string arguments that reproduce the filters of a page in its links."""
+    args = {'golf': filters['golf_id'], 'season': request.args.get('season', type=int),
+            'from': request.args.get('from') or None, 'to': request.args.get('to') or None}
+    return {name: value for name, value in args.items() if value}
+
+
+def owned_tour(tour_id):
+    """Return the tour with this id if it belongs to the current user."""
+    return Tour.query.filter_by(id=tour_id, user_id=current_user.id).first()
+
+
+def render_cached(template, build):
+    """Render a page from its cached view model, or answer 304 when the browser copy is current.
+
+    The cache key and the ETag change with the data version of the user, the
+    query string and the CSRF token window, so cached forms never carry an
+    expired token.
+    """
+    version, last_modified = data_version(current_user.id)
+    scope = f'{request.endpoint}:{current_user.id}'
+    args = urlencode(sorted(request.args.items(multi=True)))
+    token_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    token_window = int(time.time() // (token_limit // 2)) if token_limit else 0
+    etag = hashlib.sha1(f'{scope}:{version}:{args}:{token_window}'.encode()).hexdigest()
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        context = view_cache.get_or_build(scope, version, args, build)
+        response = Response(render_template(template, **context))
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def card_summary(row):
+    """Format the averages shown on the stats page from an aggregate row."""
+    num_cards = row.cards
+    fairway_pct = format(row.fairway_hits / row.fairway_possible * 100, '.1f') if row.fairway_possible else '0.0'
+    gir_pct = format(row.gir_hits / (num_cards * 18) * 100, '.1f') if num_cards else '0.0'
+    return {
+        'cards': num_cards,
+        'avg_putts': format(row.putts / num_cards, '.1f') if num_cards else '0.0',
+        'avg_putts_cards': format(row.putts / (num_cards * 18), '.1f') if num_cards else '0.0',
+        'avg_score': format(row.strokes / num_cards, '.1f') if num_cards else '0.0',
+        'avg_fairways': format(row.fairway_hits / num_cards, '.1f') if num_cards else '0.0',
+        'avg_sba': format(row.sba / num_cards, '.1f') if num_cards else '0.0',
+        'avg_nb_coups': format(row.strokes / num_cards, '.1f') if num_cards else '0.0',
+        'avg_diff': format(row.diff, '.1f') if row.diff is not None else '',
+        'fairway_pct': fairway_pct,
+        'gir_pct': gir_pct,
+    }
+
+
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
@@ -88,71 +254,58 @@ def login():
             db.session.add(user)
             db.session.commit()
         login_user(user)
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     return render_template('login.html', form=form)
 
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/')
+@main.route('/')
 @login_required
 def index():
-    golfs = {g.id: g for g in Golf.query.all()}
-    all_scores = Score.query.all()
-    scores = {s.tour_id: s for s in all_scores}
-    recent = sorted(all_scores, key=lambda x: x.id, reverse=True)[:20]
-    diffs = []
-    for s in recent:
-        holes = s.holes or []
-        total_sba = sum(h.get('adjusted') or 0 for h in holes)
-        tour = db.session.get(Tour, s.tour_id)
-        if not tour:
-            continue
-        if tour.slope and tour.sss is not None:
-            diffs.append((diff_whs(total_sba, tour.slope, tour.sss, tour.pcc), tour.id))
-    best_diff_ids = set()
-    new_index = None
-    if diffs:
-        diffs.sort(key=lambda x: x[0])
-        best_diff_ids = {tid for _, tid in diffs[:8]}
-        if len(diffs) >= 8:
-            best = [d[0] for d in diffs[:8]]
-            new_index = round(sum(best) / 8, 1)
-    tours = []
-    for idx, t in enumerate(Tour.query.order_by(Tour.date.desc()).all(), start=1):
-        score = scores.get(t.id)
-        total_score = None
-        total_sba = None
-        diff_val = None
-        if score:
-            holes = score.holes or []
-            total_score = sum(h.get('strokes', 0) for h in holes)
-            total_sba = sum(h.get('adjusted') or 0 for h in holes)
-            if t.slope and t.sss is not None:
-                diff_val = diff_whs(total_sba, t.slope, t.sss, t.pcc)
-        tours.append({
-            'doc_id': t.id,
-            'name': t.name,
-            'jour': t.jour,
-            'date': t.date,
-            'pcc': t.pcc,
-            'golf_id': t.golf_id,
-            'total_score': total_score,
-            'total_sba': int(total_sba) if total_sba is not None else None,
-            'diff_whs': diff_val,
-            'highlight_diff': t.id in best_diff_ids,
-            'has_score': score is not None,
-            'recent_no': idx if idx <= 20 else None
-        })
-    return render_template('index.html', tours=tours, golfs=golfs, new_index=new_index)
+    def build():
+        latest = current_index(current_user.id)
+        best_ids = best_score_ids(recent_rounds(current_user.id))
+        after = request.args.get('after')
+        filters = round_filters()
+        filtered = bool(filter_args(filters))
+        page, next_cursor = queries.tours_page(cursor=after, size=current_app.config['PAGE_SIZE'], **filters)
+        tours = []
+        for idx, t in enumerate(page, start=1):
+            score = t.score
+            tours.append({
+                'doc_id': t.id,
+                'name': t.name,
+                'jour': t.jour,
+                'date': t.date,
+                'pcc': t.pcc,
+                'golf_id': t.golf_id,
+                'total_score': score.total_strokes if score else None,
+                'total_sba': score.total_sba if score else None,
+                'diff_whs': score.diff if score else None,
+                'highlight_diff': score is not None and score.id in best_ids,
+                'has_score': score is not None,
+                'recent_no': idx if idx <= 20 and not after and not filtered else None
+            })
+        return {
+            'tours': tours,
+            'golfs': course_catalog().by_id,
+            'new_index': latest.value if latest else None,
+            'after': after,
+            'next_cursor': next_cursor,
+            'filters': filters,
+            'filter_args': filter_args(filters),
+            'seasons': seasons(),
+        }
+    return render_cached('index.html', build)
 
 
-@app.route('/golf', methods=['GET', 'POST'])
+@main.route('/golf', methods=['GET', 'POST'])
 @login_required
 def manage_golf():
     golf_id = request.args.get('id', type=int)
@@ -164,6 +317,7 @@ def manage_golf():
             golf = db.session.get(Golf, golf_id)
         else:
             golf = Golf()
+        old_layout = {'pars': golf.pars, 'hcps': golf.hcps}
         golf.name = form.name.data
         golf.course = form.course.data
         golf.par = form.par.data
@@ -173,44 +327,111 @@ def manage_golf():
         golf.pars = pars
         golf.hcps = hcps
         db.session.add(golf)
+        relayout = golf_id and (old_layout['pars'] != pars or old_layout['hcps'] != hcps)
+        if relayout:
+            enqueue_recompute('golf', golf.id, current_user.id, old_layout)
+        bump_version()
         db.session.commit()
-        return redirect(url_for('manage_golf'))
+        if relayout:
+            job_runner.wake()
+        return redirect(url_for('main.manage_golf'))
 
     golf = db.session.get(Golf, golf_id) if golf_id else None
     if golf and not golf.pars:
         golf.pars = [4] * 18
     if golf and not golf.hcps:
         golf.hcps = list(range(1, 19))
-    golfs = Golf.query.all()
-    return render_template('golf_form.html', golf=golf, golfs=golfs)
+    return render_template('golf_form.html', golf=golf, golfs=course_catalog().courses,
+                           summaries=course_summaries(current_user.id), jobs=active_jobs(current_user.id))
 
 
-@app.route('/golf/delete/<int:golf_id>', methods=['POST'])
+@main.route('/golf/<int:golf_id>')
+@login_required
+def course_detail(golf_id):
+    """Show a golf with the user's record, averages and hardest holes there."""
+    course = course_catalog().by_id.get(golf_id)
+    if not course:
+        abort(404)
+    summary = course_summary(current_user.id, golf_id)
+    holes = []
+    if summary and summary.hole_over_par:
+        ranked = sorted((v, i) for i, v in enumerate(summary.hole_over_par) if v is not None)
+        worst = {i for _, i in ranked[-3:]}
+        for i, over_par in enumerate(summary.hole_over_par):
+            holes.append({
+                'no': i + 1,
+                'par': course.pars[i] if course.pars else None,
+                'hcp': course.hcps[i] if course.hcps else None,
+                'over_par': over_par,
+                'putts': summary.hole_putts[i],
+                'worst': i in worst,
+            })
+    return render_template('course.html', course=course, summary=summary, holes=holes)
+
+
+@main.route('/golf/delete/<int:golf_id>', methods=['POST'])
 @login_required
 def delete_golf(golf_id):
     golf = db.session.get(Golf, golf_id)
     if golf:
+        CourseSummary.query.filter_by(golf_id=golf_id).delete()
         db.session.delete(golf)
+        bump_version()
         db.session.commit()
-    return redirect(url_for('manage_golf'))
+    return redirect(url_for('main.manage_golf'))
 
 
-@app.route('/add_tour', methods=['GET', 'POST'])
+@main.route('/golfs.json')
+@login_required
+def golfs_json():
+    """Serve the course catalog payload, revalidated by the browser with its ETag."""
+    catalog = course_catalog()
+    response = Response(catalog.json, mimetype='application/json')
+    response.set_etag(f'{CATALOG_SCOPE}-{catalog.version}')
+    response.last_modified = catalog.last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@main.route('/golfs/search.json')
+@login_required
+def golfs_search_json():
+    """Type-ahead for the course pickers: the courses matching `q`, best first."""
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    courses = search_courses(request.args.get('q'), limit)
+    return jsonify(golfs=[{'id': c.id, 'name': c.name, 'course': c.course, 'tees': c.tees} for c in courses])
+
+
+@main.route('/search')
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    golfs = course_catalog().by_id
+    return render_template('search.html', query=query, courses=search_courses(query, courses=golfs),
+                           tours=search_tours(current_user.id, query), golfs=golfs)
+
+
+@main.route('/add_tour', methods=['GET', 'POST'])
 @login_required
 def add_tour():
     tour_id = request.args.get('id', type=int)
+    tour = owned_tour(tour_id) if tour_id else None
+    if tour_id and not tour:
+        abort(404)
     form = TourForm()
-    form.golf.choices = [(g.id, g.name) for g in Golf.query.all()]
+    catalog = course_catalog()
+    form.golf.choices = catalog.choices()
     if form.validate_on_submit():
         pars = [request.form.get(f'par_{i}', type=int) for i in range(1, 19)]
         hcps = [request.form.get(f'hcp_{i}', type=int) for i in range(1, 19)]
-        if tour_id:
-            tour = db.session.get(Tour, tour_id)
-        else:
+        if not tour:
             tour = Tour(user_id=current_user.id)
+        previous_date, previous_golf = tour.date, tour.golf_id
+        previous_scoring = (tour.slope, tour.sss, tour.pcc, tour.pars, tour.hcps)
         tour.name = form.name.data
         tour.jour = form.jour.data
-        tour.date = form.date.data.strftime('%Y-%m-%d')
+        tour.date = form.date.data
         tour.golf_id = form.golf.data
         tour.par = form.par.data
         tour.slope = form.slope.data
@@ -219,114 +440,119 @@ def add_tour():
         tour.pars = pars
         tour.hcps = hcps
         db.session.add(tour)
+        rescore = tour.score is not None and previous_scoring != (tour.slope, tour.sss, tour.pcc, pars, hcps)
+        if rescore:
+            update_score_totals(tour.score, tour)
+            enqueue_recompute('tour', tour.id, current_user.id)
+        bump_version(current_user.id)
         db.session.commit()
-        return redirect(url_for('index'))
+        if tour_id:
+            update_index_history(tour.user_id, earliest(previous_date, tour.date))
+            if tour.score is not None:
+                refresh_course_summaries(tour.user_id, {previous_golf, tour.golf_id})
+        if rescore:
+            job_runner.wake()
+        return redirect(url_for('main.index'))
 
-    tour = db.session.get(Tour, tour_id) if tour_id else None
     if tour and not tour.hcps:
         tour.hcps = list(range(1, 19))
-    golfs = Golf.query.all()
-    return render_template('add_tour.html', tour=tour, golfs=golfs, golfs_json=[{**g.__dict__, 'doc_id': g.id} for g in golfs])
+    return render_template('add_tour.html', tour=tour, golfs=catalog.courses, golfs_json=catalog.json)
 
 
-@app.route('/tour/delete/<int:tour_id>', methods=['POST'])
+@main.route('/tour/delete/<int:tour_id>', methods=['POST'])
 @login_required
 def delete_tour(tour_id):
-    tour = db.session.get(Tour, tour_id)
+    tour = owned_tour(tour_id)
     if tour:
+        user_id, date, golf_id = tour.user_id, tour.date, tour.golf_id
+        for score in Score.query.filter_by(tour_id=tour_id):
+            Stats.query.filter_by(score_id=score.id).delete()
+            db.session.delete(score)
         db.session.delete(tour)
+        bump_version(current_user.id)
         db.session.commit()
-    return redirect(url_for('index'))
+        update_index_history(user_id, date)
+        refresh_course_summaries(user_id, [golf_id])
+    return redirect(url_for('main.index'))
 
 
-@app.route('/start_score', methods=['GET', 'POST'])
+@main.route('/start_score', methods=['GET', 'POST'])
 @login_required
 def start_score():
+    catalog = course_catalog()
     if request.method == 'POST':
         golf_id = request.form.get('golf', type=int)
         name = request.form.get('name')
         jour = request.form.get('jour', type=int)
-        date = request.form.get('date')
+        try:
+            date = importer.parse_date(request.form.get('date'))
+        except ValueError:
+            date = None
         pcc = request.form.get('pcc', type=int) or 0
-        golf = db.session.get(Golf, golf_id)
-        if golf:
+        golf = catalog.by_id.get(golf_id)
+        if golf and date:
             tour = Tour(name=name, jour=jour, date=date, golf_id=golf_id, par=golf.par,
-                        slope=golf.slope, sss=golf.sss, pcc=pcc, pars=golf.pars,
-                        hcps=golf.hcps, user_id=current_user.id)
+                        slope=golf.slope, sss=golf.sss, pcc=pcc, pars=golf.pars and list(golf.pars),
+                        hcps=golf.hcps and list(golf.hcps), user_id=current_user.id)
             db.session.add(tour)
+            bump_version(current_user.id)
             db.session.commit()
-            return redirect(url_for('add_score', tour_id=tour.id))
-    golfs = Golf.query.all()
-    return render_template('start_score.html', golfs=golfs)
+            return redirect(url_for('main.add_score', tour_id=tour.id))
+    return render_template('start_score.html', golfs=catalog.courses)
 
 
-@app.route('/add_score/<int:tour_id>', methods=['GET', 'POST'])
+@main.route('/add_score/<int:tour_id>', methods=['GET', 'POST'])
 @login_required
 def add_score(tour_id):
-    tour = db.session.get(Tour, tour_id)
+    tour = owned_tour(tour_id)
     if not tour:
-        return redirect(url_for('index'))
-    score = Score.query.filter_by(tour_id=tour_id).first()
+        return redirect(url_for('main.index'))
+    score = tour.score
     if request.method == 'POST':
         pcc_val = request.form.get('pcc', type=int) or 0
         tour.pcc = pcc_val
         handicap = request.form.get('handicap', type=int)
-        hcps = tour.hcps or list(range(1, 19))
-        given_dist = distribute_handicap(handicap, hcps)
         holes = []
         for i in range(1, 19):
-            par = request.form.get(f'par_{i}', type=int)
-            strokes = request.form.get(f'strokes_{i}', type=int)
-            given = given_dist[i-1]
-            limit = par + 2 + given
-            adjusted_from_form = request.form.get(f'adjusted_{i}', type=int)
-            if adjusted_from_form is not None and score:
-                adjusted = adjusted_from_form
-            else:
-                adjusted = min(strokes, limit) if strokes is not None else None
-            hole = {
-                'par': par,
-                'strokes_given': given,
-                'strokes': strokes,
-                'adjusted': adjusted,
+            holes.append({
+                'par': request.form.get(f'par_{i}', type=int),
+                'strokes': request.form.get(f'strokes_{i}', type=int),
+                'adjusted': request.form.get(f'adjusted_{i}', type=int) if score else None,
                 'fairway': bool(request.form.get(f'fairway_{i}')),
                 'gir': bool(request.form.get(f'gir_{i}')),
                 'putts': request.form.get(f'putts_{i}', type=int)
-            }
-            holes.append(hole)
+            })
+        score_holes(holes, handicap, tour.hcps or list(range(1, 19)))
         if not score:
             score = Score(tour_id=tour_id)
         score.handicap = handicap
-        score.holes = holes
+        score.set_holes(holes)
+        update_score_totals(score, tour)
         db.session.add(score)
+        bump_version(current_user.id)
         db.session.commit()
 
-        fairway_possible = sum(1 for h in holes if h['par'] != 3)
-        fairway_hits = sum(1 for h in holes if h['par'] != 3 and h['fairway'])
-        gir_hits = sum(1 for h in holes if h['gir'])
-        total_putts = sum(h['putts'] for h in holes)
-        avg_putts = format(total_putts / 18, '.1f')
-        stats = Stats.query.filter_by(score_id=score.id).first()
+        values = card_stats(holes)
+        stats = score.stats
         if not stats:
             stats = Stats(score_id=score.id, tour_id=tour_id)
-        stats.fairway_hits = fairway_hits
-        stats.fairway_possible = fairway_possible
-        stats.gir_hits = gir_hits
-        stats.putts_total = total_putts
-        stats.putts_avg = avg_putts
+            score.stats = stats
+        for key, value in values.items():
+            setattr(stats, key, value)
         db.session.add(stats)
         db.session.commit()
+        update_index_history(tour.user_id, tour.date)
+        refresh_course_summaries(tour.user_id, [tour.golf_id])
 
-        diff_val = None
-        if tour.slope and tour.sss is not None:
-            diff_val = diff_whs(sum(h['adjusted'] for h in holes), tour.slope, tour.sss, tour.pcc)
+        diff_val = score.diff
+        putts_avg_cards = queries.putts_average(current_user.id)
         summary = {
-            'fairway': f"{fairway_hits}/{fairway_possible}",
-            'putts_total': total_putts,
-            'putts_avg': avg_putts,
-            'gir': f"{gir_hits}/18",
+            'fairway': f"{values['fairway_hits']}/{values['fairway_possible']}",
+            'putts_total': values['putts_total'],
+            'putts_avg': values['putts_avg'],
+            'gir': f"{values['gir_hits']}/18",
             'diff_whs': format(diff_val, '.1f') if diff_val is not None else None,
-            'putts_avg_cards': format(sum(s.putts_total for s in Stats.query.all())/(len(Stats.query.all())*18), '.1f') if Stats.query.all() else '0.0'
+            'putts_avg_cards': format(putts_avg_cards, '.1f') if putts_avg_cards is not None else '0.0'
         }
         return render_template('score_summary.html', stats=summary)
 
@@ -337,142 +563,164 @@ def add_score(tour_id):
     return render_template('add_score.html', tour=tour, score=score)
 
 
-@app.route('/scores')
+@main.route('/scores')
 @login_required
 def list_scores():
-    current_index = request.args.get('index', type=float)
-    sort_key = request.args.get('sort', 'date')
-    golf_filter = request.args.get('golf', type=int)
-    golfs = {g.id: g for g in Golf.query.all()}
-    tours = {t.id: t for t in Tour.query.all()}
-    cards = []
-    for s in Score.query.all():
-        tour = tours.get(s.tour_id)
-        if not tour:
-            continue
-        if golf_filter and tour.golf_id != golf_filter:
-            continue
-        holes = s.holes or []
-        total_score = sum(h.get('strokes', 0) for h in holes)
-        total_sba = sum(h.get('adjusted') or 0 for h in holes)
-        diff = None
-        emoji = ''
-        if tour.slope and tour.sss is not None:
-            diff = diff_whs(total_sba, tour.slope, tour.sss, tour.pcc)
-            if current_index is not None:
-                if diff < current_index:
-                    emoji = '🔻'
-                elif diff > current_index:
-                    emoji = '🔺'
-                else:
-                    emoji = '➡️'
-        cards.append({
-            'tour': tour,
-            'golf': golfs.get(tour.golf_id),
-            'total_score': total_score,
-            'total_sba': int(total_sba),
-            'diff': diff,
-            'emoji': emoji,
-        })
-    if sort_key == 'diff':
-        cards.sort(key=lambda x: (x['diff'] is None, x.get('diff')))
-    else:
-        cards.sort(key=lambda x: x['tour'].date or '')
-    return render_template(
-        'scores_list.html',
-        cards=cards,
-        current_index=current_index,
-        sort=sort_key,
-        golfs=golfs,
-        golf_filter=golf_filter,
-    )
+    def build():
+        current_index = request.args.get('index', type=float)
+        sort_key = request.args.get('sort', 'date')
+        filters = round_filters()
+        after = request.args.get('after')
+        golfs = course_catalog().by_id
+        page, next_cursor = queries.cards_page(sort=sort_key, cursor=after, size=current_app.config['PAGE_SIZE'],
+                                               **filters)
+        cards = []
+        for s in page:
+            tour = s.tour
+            diff = s.diff
+            emoji = ''
+            if diff is not None:
+                if current_index is not None:
+                    if diff < current_index:
+                        emoji = '🔻'
+                    elif diff > current_index:
+                        emoji = '🔺'
+                    else:
+                        emoji = '➡️'
+            cards.append({
+                'tour': {'id': tour.id, 'name': tour.name, 'jour': tour.jour, 'date': tour.date, 'pcc': tour.pcc},
+                'golf': golfs.get(tour.golf_id),
+                'total_score': s.total_strokes,
+                'total_sba': s.total_sba,
+                'diff': diff,
+                'emoji': emoji,
+            })
+        return {
+            'cards': cards,
+            'current_index': current_index,
+            'sort': sort_key,
+            'golfs': golfs,
+            'filters': filters,
+            'filter_args': filter_args(filters),
+            'seasons': seasons(),
+            'after': after,
+            'next_cursor': next_cursor,
+        }
+    return render_cached('scores_list.html', build)
 
 
-@app.route('/view_score/<int:tour_id>')
+@main.route('/view_score/<int:tour_id>')
 @login_required
 def view_score(tour_id):
-    tour = db.session.get(Tour, tour_id)
-    score = Score.query.filter_by(tour_id=tour_id).first()
-    stats = Stats.query.filter_by(tour_id=tour_id).first()
-    if not tour or not score:
-        return redirect(url_for('index'))
-    diff_val = None
-    if tour.slope and tour.sss is not None:
-        diff_val = diff_whs(
-            sum(h.get('adjusted') or 0 for h in score.holes or []),
-            tour.slope,
-            tour.sss,
-            tour.pcc,
-        )
-    return render_template('view_score.html', tour=tour, score=score, stats=stats, diff=diff_val)
-
-
-@app.route('/export/csv')
+    score = queries.card_for_tour(tour_id, current_user.id)
+    archived = score is None and archive.archived_card(tour_id, current_user.id)
+    score = score or archived
+    if not score or not score.tour:
+        return redirect(url_for('main.index'))
+    return render_template('view_score.html', tour=score.tour, score=score, stats=score.stats, diff=score.diff,
+                           archived=bool(archived))
+
+
+@main.route('/import', methods=['GET', 'POST'])
 @login_required
-def export_csv():
-    fp = os.path.join(app.instance_path, 'scores.csv')
-    os.makedirs(app.instance_path, exist_ok=True)
-    with open(fp, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Tour', 'Date', 'Total', 'SBA', 'Diff'])
-        for s in Score.query.all():
-            t = db.session.get(Tour, s.tour_id)
-            holes = s.holes or []
-            total_score = sum(h.get('strokes', 0) for h in holes)
-            total_sba = sum(h.get('adjusted') or 0 for h in holes)
-            diff = diff_whs(total_sba, t.slope, t.sss, t.pcc) if t.slope and t.sss else ''
-            writer.writerow([t.name, t.date, total_score, total_sba, diff])
-    return send_file(fp, as_attachment=True)
-
-
-@app.route('/stats')
+def import_scores():
+    report = None
+    upload = request.files.get('file')
+    if request.method == 'POST' and upload and upload.filename:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = importer.import_cards(importer.read_cards(stream, importer.detect_format(upload.filename)),
+                                       current_user.id)
+    return render_template('import.html', report=report)
+
+
+@main.route('/export/<fmt>')
+@login_required
+def export_scores(fmt):
+    if fmt not in export.FORMATS:
+        abort(404)
+    mimetype, filename = export.FORMATS[fmt]
+    rows = export.export_stream(fmt, **round_filters())
+    return Response(
+        stream_with_context(rows),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
+@main.route('/stats')
 @login_required
 def overall_stats():
-    stats_entries = Stats.query.all()
-    score_entries = Score.query.all()
-    num_cards = len(stats_entries)
-    total_putts = sum(s.putts_total for s in stats_entries)
-    total_fairway_hits = sum(s.fairway_hits for s in stats_entries)
-    total_fairway_possible = sum(s.fairway_possible for s in stats_entries)
-    total_gir_hits = sum(s.gir_hits for s in stats_entries)
-    total_scores = 0
-    total_sba = 0
-    diffs = []
-    for s in score_entries:
-        holes = s.holes or []
-        card_score_total = sum(h.get('strokes', 0) for h in holes)
-        total_scores += card_score_total
-        card_sba_total = sum(h.get('adjusted') or 0 for h in holes)
-        total_sba += card_sba_total
-        t = db.session.get(Tour, s.tour_id)
-        if t and t.slope and t.sss is not None:
-            diffs.append(diff_whs(card_sba_total, t.slope, t.sss, t.pcc))
-    avg_putts = format(total_putts / num_cards, '.1f') if num_cards else '0.0'
-    avg_putts_cards = format(total_putts / (num_cards * 18), '.1f') if num_cards else '0.0'
-    avg_score = format(total_scores / num_cards, '.1f') if num_cards else '0.0'
-    avg_fairways = format(total_fairway_hits / num_cards, '.1f') if num_cards else '0.0'
-    avg_sba = format(total_sba / num_cards, '.1f') if num_cards else '0.0'
-    avg_nb_coups = format(total_scores / num_cards, '.1f') if num_cards else '0.0'
-    fairway_pct = format(total_fairway_hits / total_fairway_possible * 100, '.1f') if total_fairway_possible else '0.0'
-    gir_possible = num_cards * 18
-    gir_pct = format(total_gir_hits / gir_possible * 100, '.1f') if gir_possible else '0.0'
-    stats = {
-        'avg_putts': avg_putts,
-        'avg_putts_cards': avg_putts_cards,
-        'avg_score': avg_score,
-        'avg_fairways': avg_fairways,
-        'fairway_pct': fairway_pct,
-        'gir_pct': gir_pct,
-        'avg_sba': avg_sba,
-        'avg_nb_coups': avg_nb_coups,
-        'diff_labels': list(range(1, len(diffs)+1)),
-        'diff_values': diffs,
-    }
-    return render_template('stats_overall.html', stats=stats)
+    def build():
+        filters = round_filters()
+        period = request.args.get('period', 'month')
+        golfs = course_catalog().by_id
+        archived = archive.season_summaries(**filters)
+        diffs = [diff for _, _, diff in archive.archived_rounds(archived)] + queries.diff_series(**filters)
+        history = (IndexHistory.query.filter_by(user_id=current_user.id)
+                   .filter(IndexHistory.value.is_not(None))
+                   .order_by(IndexHistory.date, IndexHistory.score_id).all())
+        stats = card_summary(archive.merge_aggregates([queries.card_aggregates(**filters)], archived)[0])
+        stats.update({
+            'diff_labels': list(range(1, len(diffs)+1)),
+            'diff_values': diffs,
+            'index_labels': [h.date.isoformat() if h.date else '' for h in history],
+            'index_values': [h.value for h in history],
+            'per_hole': [
+                {
+                    'hole_no': hole_no,
+                    'over_par': format(over_par or 0, '+.2f'),
+                    'putts': format(putts or 0, '.2f'),
+                    'gir_pct': format(gir or 0, '.1f'),
+                }
+                for hole_no, over_par, putts, gir
+                in archive.merge_hole_averages(queries.hole_averages(**filters), archived)
+            ],
+        })
+        by_golf = []
+        for row in archive.merge_aggregates(queries.card_aggregates(Tour.golf_id, **filters), archived,
+                                            lambda summary: summary.golf_id):
+            golf = golfs.get(row.key)
+            by_golf.append({'label': golf.name if golf else '', **card_summary(row)})
+        # Archived seasons only have yearly sums, shown as one row in the monthly view.
+        by_period = [
+            {'label': row.key or '', **card_summary(row)}
+            for row in archive.merge_aggregates(queries.card_aggregates(queries.period_key(period), **filters),
+                                                archived, lambda summary: str(summary.season))
+        ]
+        return {
+            'stats': stats,
+            'by_golf': by_golf,
+            'by_period': by_period,
+            'golfs': golfs,
+            'golf_filter': filters['golf_id'],
+            'date_from': filters['date_from'],
+            'date_to': filters['date_to'],
+            'season': request.args.get('season', type=int),
+            'seasons': seasons(),
+            'period': period,
+        }
+    return render_cached('stats_overall.html', build)
+
+
+@main.route('/analytics')
+@login_required
+def analytics_page():
+    filters = round_filters()
+    return render_template(
+        'analytics.html',
+        analytics=HoleMatrix.load(**filters).summary(),
+        golfs=course_catalog().by_id,
+        golf_filter=filters['golf_id'],
+        date_from=filters['date_from'],
+        date_to=filters['date_to'],
+    )
+
+
+@main.route('/analytics.json')
+@login_required
+def analytics_json():
+    return jsonify(HoleMatrix.load(**round_filters()).summary())
 
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        migrate_from_tinydb()
-    app.run(debug=True, host='0.0.0.0')
+    create_app().run(debug=True, host='0.0.0.0')
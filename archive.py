@@ -0,0 +1,310 @@
+"""Cold storage of old seasons.
+
+Rounds played before a cutoff move, with their score, holes and stats, to a
+separate SQLite file attached to each connection as the `archive` schema
+(see database.setup_sqlite), so the hot tables and their indexes only hold
+the recent seasons. A SeasonSummary per season and golf keeps the archived
+rounds in the stats, the course summaries and the index history; cards are
+read back from the archive for view_score and the exports.
+"""
+import sqlite3
+from datetime import date
+from types import SimpleNamespace
+from typing import NamedTuple, Optional
+
+from flask import current_app
+from sqlalchemy import Column, Index, Integer, MetaData, Table, and_, cast, delete, func, insert, select
+
+from cache import bump_version
+from database import ARCHIVE_SCHEMA
+from models import db, HoleResult, Score, SeasonSummary, Stats, Tour
+
+archive_metadata = MetaData(schema=ARCHIVE_SCHEMA)
+
+
+def _archive_table(model, *indexes):
+    """Copy the table of a model into the archive schema, without its foreign keys."""
+    columns = [Column(c.name, c.type, primary_key=c.primary_key) for c in model.__table__.columns]
+    return Table(model.__tablename__, archive_metadata, *columns, *indexes)
+
+
+archived_tours = _archive_table(Tour, Index('ix_archive_tour_user_date', 'user_id', 'date'))
+archived_scores = _archive_table(Score, Index('ix_archive_score_tour', 'tour_id'))
+archived_holes = _archive_table(HoleResult, Index('ix_archive_hole_result_score_hole', 'score_id', 'hole_no'))
+archived_stats = _archive_table(Stats, Index('ix_archive_stats_score', 'score_id'))
+# Sums added up over the seasons; the differential is averaged separately.
+SUMS = ('cards', 'strokes', 'sba', 'putts', 'fairway_hits', 'fairway_possible', 'gir_hits')
+
+
+class Aggregate(NamedTuple):
+    """A card_aggregates row with the archived seasons of its group added."""
+    key: object
+    cards: int
+    strokes: int
+    sba: int
+    putts: int
+    fairway_hits: int
+    fairway_possible: int
+    gir_hits: int
+    diff: Optional[float]
+    diff_count: int
+
+
+def archive_attached():
+    """Tell whether the archive file is attached to the session's connection."""
+    return db.session.connection().info.get(ARCHIVE_SCHEMA, False)
+
+
+def open_archive():
+    """Create the archive file and its tables if needed, and return its path.
+
+    A new file is only attached by the connections opened afterwards, so the
+    pool is emptied; running web processes see it once restarted.
+    """
+    path = current_app.config.get('ARCHIVE_PATH')
+    if not path:
+        raise ValueError("pas de fichier d'archive pour cette base de données")
+    if not archive_attached():
+        sqlite3.connect(path).close()
+        db.session.remove()
+        db.engine.dispose()
+    archive_metadata.create_all(db.engine)
+    return path
+
+
+def _chunk_tables(tour_ids):
+    """Return each hot table, its archived copy and the condition selecting the rows of some tours."""
+    score_ids = select(Score.id).where(Score.tour_id.in_(tour_ids))
+    return (
+        (Tour.__table__, archived_tours, Tour.id.in_(tour_ids)),
+        (Score.__table__, archived_scores, Score.tour_id.in_(tour_ids)),
+        (HoleResult.__table__, archived_holes, HoleResult.score_id.in_(score_ids)),
+        (Stats.__table__, archived_stats, Stats.score_id.in_(score_ids)),
+    )
+
+
+def _archived_copies(tour_ids):
+    """Return the ids of the tours already copied to the archive by an interrupted run."""
+    t = archived_tours.c
+    query = (db.session.query(Tour.id)
+             .join(archived_tours, and_(t.id == Tour.id, t.user_id == Tour.user_id, t.date == Tour.date))
+             .filter(Tour.id.in_(tour_ids)))
+    return {tour_id for (tour_id,) in query}
+
+
+def archive_rounds(before, chunk_size=500, progress=None):
+    """Move the rounds played before `before` to the archive and return how many moved.
+
+    Each chunk of a user's rounds is copied in one transaction, then removed
+    from the hot tables with the summaries of its seasons updated in the
+    next: in WAL mode SQLite commits the main and the attached files
+    separately, so an interruption leaves rounds in both files rather than
+    in none, and running the command again finishes moving them: a tour
+    already in the archive with the same user and date is only removed
+    from the hot tables. Any other archived row with the id of a row to
+    copy fails the chunk rather than being overwritten.
+    """
+    user_ids = [uid for (uid,) in db.session.query(Tour.user_id).filter(Tour.user_id.is_not(None)).distinct()]
+    moved = 0
+    for user_id in user_ids:
+        while True:
+            rows = (db.session.query(Tour.id, Tour.date)
+                    .filter(Tour.user_id == user_id, Tour.date < before)
+                    .order_by(Tour.date, Tour.id).limit(chunk_size).all())
+            if not rows:
+                break
+            tour_ids = [tour_id for tour_id, _ in rows]
+            copied = _archived_copies(tour_ids)
+            for table, archived, condition in _chunk_tables([i for i in tour_ids if i not in copied]):
+                db.session.execute(insert(archived).from_select(list(table.c.keys()), select(table).where(condition)))
+            db.session.commit()
+            tables = _chunk_tables(tour_ids)
+            for table, _, condition in reversed(tables):
+                db.session.execute(delete(table).where(condition))
+            refresh_season_summaries(user_id, {played.year for _, played in rows})
+            moved += len(rows)
+            if progress:
+                progress(moved)
+    # The last look for rounds began a write transaction: end it.
+    db.session.commit()
+    return moved
+
+
+def _season_rounds(user_id, season):
+    t = archived_tours.c
+    return (t.user_id == user_id, t.date >= date(season, 1, 1), t.date < date(season + 1, 1, 1))
+
+
+def refresh_season_summaries(user_id, seasons):
+    """Recompute a user's summaries of some seasons from their archived rounds."""
+    t, s, st, h = archived_tours.c, archived_scores.c, archived_stats.c, archived_holes.c
+    for season in seasons:
+        rounds = db.session.execute(
+            select(t.golf_id, t.id.label('tour_id'), t.date, s.id.label('score_id'), s.total_strokes,
+                   s.total_sba, s.diff, st.putts_total, st.fairway_hits, st.fairway_possible, st.gir_hits)
+            .select_from(archived_tours)
+            .join(archived_scores, s.tour_id == t.id)
+            .outerjoin(archived_stats, st.score_id == s.id)
+            .where(*_season_rounds(user_id, season))
+            .order_by(t.date, s.id)
+        ).all()
+        over_par = h.strokes - h.par
+        gir = cast(h.gir, Integer)
+        hole_rows = db.session.execute(
+            select(t.golf_id, h.hole_no, func.coalesce(func.sum(over_par), 0), func.count(over_par),
+                   func.coalesce(func.sum(h.putts), 0), func.count(h.putts),
+                   func.coalesce(func.sum(gir), 0), func.count(gir))
+            .select_from(archived_tours)
+            .join(archived_scores, s.tour_id == t.id)
+            .join(archived_holes, h.score_id == s.id)
+            .where(*_season_rounds(user_id, season))
+            .group_by(t.golf_id, h.hole_no)
+        ).all()
+
+        summaries = {}
+        for r in rounds:
+            summary = summaries.get(r.golf_id)
+            if summary is None:
+                summary = summaries[r.golf_id] = {
+                    'user_id': user_id, 'season': season, 'golf_id': r.golf_id, 'diff_sum': 0.0, 'diff_count': 0,
+                    'best_strokes': None, 'best_sba': None, 'best_diff': None, 'best_tour_id': None,
+                    'holes': [[0] * 6 for _ in range(18)], 'diffs': [], **dict.fromkeys(SUMS, 0),
+                }
+            summary['cards'] += 1
+            summary['strokes'] += r.total_strokes or 0
+            summary['sba'] += r.total_sba or 0
+            summary['putts'] += r.putts_total or 0
+            summary['fairway_hits'] += r.fairway_hits or 0
+            summary['fairway_possible'] += r.fairway_possible or 0
+            summary['gir_hits'] += r.gir_hits or 0
+            # Rounds come in date order, so the best card is the earliest one on ties.
+            if r.total_strokes is not None and (summary['best_strokes'] is None
+                                                or r.total_strokes < summary['best_strokes']):
+                summary['best_strokes'] = r.total_strokes
+                summary['best_tour_id'] = r.tour_id
+            if r.total_sba is not None:
+                summary['best_sba'] = r.total_sba if summary['best_sba'] is None else min(summary['best_sba'],
+                                                                                          r.total_sba)
+            if r.diff is not None:
+                summary['best_diff'] = r.diff if summary['best_diff'] is None else min(summary['best_diff'], r.diff)
+                summary['diff_sum'] += r.diff
+                summary['diff_count'] += 1
+                summary['diffs'].append([r.date.isoformat(), r.score_id, r.diff])
+            summary['last_played'] = r.date
+        for golf_id, hole_no, *sums in hole_rows:
+            if golf_id in summaries and 1 <= hole_no <= 18:
+                summaries[golf_id]['holes'][hole_no - 1] = sums
+
+        SeasonSummary.query.filter_by(user_id=user_id, season=season).delete()
+        if summaries:
+            db.session.execute(insert(SeasonSummary.__table__), list(summaries.values()))
+    bump_version(user_id)
+    db.session.commit()
+
+
+def season_summaries(user_id, golf_id=None, date_from=None, date_to=None):
+    """Return a user's season summaries, limited to the seasons wholly within the date range."""
+    query = SeasonSummary.query.filter_by(user_id=user_id)
+    if golf_id:
+        query = query.filter(SeasonSummary.golf_id == golf_id)
+    if date_from:
+        query = query.filter(SeasonSummary.season >= date_from.year + (date_from > date(date_from.year, 1, 1)))
+    if date_to:
+        query = query.filter(SeasonSummary.season <= date_to.year - (date_to < date(date_to.year, 12, 31)))
+    return query.order_by(SeasonSummary.season, SeasonSummary.golf_id).all()
+
+
+def merge_aggregates(rows, summaries, key=lambda summary: None):
+    """Add season summaries to card_aggregates rows of the same group, in group order.
+
+    `key` gives the group of a summary: None for the overall row, its golf
+    id or its season as text for the per-golf and per-period rows.
+    """
+    totals = {row.key: [getattr(row, name) for name in SUMS] + [(row.diff or 0) * row.diff_count, row.diff_count]
+              for row in rows}
+    for summary in summaries:
+        total = totals.setdefault(key(summary), [0] * (len(SUMS) + 2))
+        for i, name in enumerate(SUMS):
+            total[i] += getattr(summary, name)
+        total[-2] += summary.diff_sum
+        total[-1] += summary.diff_count
+    return [
+        Aggregate(group, *total[:-2], total[-2] / total[-1] if total[-1] else None, total[-1])
+        for group, total in sorted(totals.items(), key=lambda item: (item[0] is not None, item[0]))
+    ]
+
+
+def merge_hole_averages(rows, summaries):
+    """Add season summaries to hole_averages rows, as (hole_no, over_par, putts, gir_pct) per hole."""
+    holes = {hole_no: [(over_par or 0) * over_n, over_n, (putts or 0) * putts_n, putts_n,
+                       (gir or 0) / 100 * gir_n, gir_n]
+             for hole_no, over_par, putts, gir, over_n, putts_n, gir_n in rows}
+    for summary in summaries:
+        for hole_no, sums in enumerate(summary.holes or [], start=1):
+            if sums[1] or sums[3] or sums[5]:
+                total = holes.setdefault(hole_no, [0] * 6)
+                for i, value in enumerate(sums):
+                    total[i] += value
+    return [
+        (hole_no, over / over_n if over_n else None, putts / putts_n if putts_n else None,
+         gir / gir_n * 100 if gir_n else None)
+        for hole_no, (over, over_n, putts, putts_n, gir, gir_n) in sorted(holes.items())
+    ]
+
+
+def archived_rounds(summaries, since=None):
+    """Return the (score id, date, differential) of the archived rounds of some summaries, in date order."""
+    rounds = sorted(
+        (date.fromisoformat(played), score_id, diff)
+        for summary in summaries for played, score_id, diff in summary.diffs or []
+    )
+    return [(score_id, played, diff) for played, score_id, diff in rounds if since is None or played >= since]
+
+
+def archived_cards(user_id, golf_id=None, date_from=None, date_to=None, tour_id=None, holes=True, stats=False,
+                   batch_size=1000):
+    """Yield a user's archived cards in score order, as namespaces shaped like the Score models.
+
+    Each score has its `tour`, and its `holes` and `stats` when asked for;
+    nothing is yielded when the archive is not attached.
+    """
+    if not archive_attached():
+        return
+    t, s, h, st = archived_tours.c, archived_scores.c, archived_holes.c, archived_stats.c
+    query = (select(*t, s.id.label('score_id'), s.handicap, s.total_strokes, s.total_sba, s.diff)
+             .select_from(archived_tours).join(archived_scores, s.tour_id == t.id).where(t.user_id == user_id))
+    if golf_id:
+        query = query.where(t.golf_id == golf_id)
+    if date_from:
+        query = query.where(t.date >= date_from)
+    if date_to:
+        query = query.where(t.date <= date_to)
+    if tour_id:
+        query = query.where(t.id == tour_id)
+    last_id = 0
+    while True:
+        rows = db.session.execute(query.where(s.id > last_id).order_by(s.id).limit(batch_size)).all()
+        if not rows:
+            return
+        score_ids = [row.score_id for row in rows]
+        card_holes, card_stats = {}, {}
+        if holes:
+            for hole in db.session.execute(select(archived_holes).where(h.score_id.in_(score_ids))
+                                           .order_by(h.score_id, h.hole_no)):
+                card_holes.setdefault(hole.score_id, []).append(hole)
+        if stats:
+            card_stats = {row.score_id: row
+                          for row in db.session.execute(select(archived_stats).where(st.score_id.in_(score_ids)))}
+        for row in rows:
+            tour = SimpleNamespace(**{name: getattr(row, name) for name in t.keys()})
+            yield SimpleNamespace(id=row.score_id, tour_id=tour.id, handicap=row.handicap,
+                                  total_strokes=row.total_strokes, total_sba=row.total_sba, diff=row.diff,
+                                  tour=tour, holes=card_holes.get(row.score_id, []), stats=card_stats.get(row.score_id))
+        if len(rows) < batch_size:
+            return
+        last_id = score_ids[-1]
+
+
+def archived_card(tour_id, user_id):
+    """Return the archived score of a user's tour, or None."""
+    return next(archived_cards(user_id, tour_id=tour_id, stats=True), None)
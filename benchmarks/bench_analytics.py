@@ -0,0 +1,103 @@
+"""Compare the NumPy hole analytics with a pure-Python implementation.
+
+Run from the project root:
+
+    python -m benchmarks.bench_analytics --cards 100000
+"""
+import argparse
+import random
+import time
+
+from analytics import MAX_PUTTS, PAR_TYPES, HoleMatrix
+
+
+def make_cards(n, seed=0):
+    rng = random.Random(seed)
+    pars = [rng.choice(PAR_TYPES) for _ in range(18)]
+    hcps = rng.sample(range(1, 19), 18)
+    cards = []
+    for _ in range(n):
+        holes = []
+        for par in pars:
+            putts = rng.choice((0, 1, 1, 2, 2, 2, 2, 3, 3, 4))
+            holes.append({
+                'par': par,
+                'strokes': par + rng.randint(-1, 4),
+                'putts': putts,
+                'gir': rng.random() < 0.3,
+            })
+        cards.append({'holes': holes, 'hcps': hcps})
+    return cards
+
+
+def _mean(values):
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def python_summary(cards):
+    """Reference implementation looping over every hole dict."""
+    by_hole = [[] for _ in range(18)]
+    putts_by_hole = [[] for _ in range(18)]
+    by_par = {par: [] for par in PAR_TYPES}
+    by_hcp = {hcp: [] for hcp in range(1, 19)}
+    gir = {True: ([], []), False: ([], [])}
+    putts_counts = [0] * (MAX_PUTTS + 1)
+    for card in cards:
+        for i, (hole, hcp) in enumerate(zip(card['holes'], card['hcps'])):
+            over = hole['strokes'] - hole['par']
+            by_hole[i].append(over)
+            putts_by_hole[i].append(hole['putts'])
+            by_par[hole['par']].append(over)
+            by_hcp[hcp].append(over)
+            gir[bool(hole['gir'])][0].append(over)
+            gir[bool(hole['gir'])][1].append(hole['putts'])
+            putts_counts[min(hole['putts'], MAX_PUTTS)] += 1
+    total = sum(putts_counts)
+    return {
+        'cards': len(cards),
+        'by_hole': [{'hole_no': i + 1, 'over_par': _mean(by_hole[i]), 'putts': _mean(putts_by_hole[i])}
+                    for i in range(18)],
+        'by_par': [{'par': par, 'holes': len(by_par[par]), 'over_par': _mean(by_par[par])} for par in PAR_TYPES],
+        'putts_distribution': [{'putts': n, 'holes': count, 'pct': round(count / total * 100, 1) if total else 0.0}
+                               for n, count in enumerate(putts_counts)],
+        'gir_vs_score': [{'gir': g, 'holes': len(gir[g][0]), 'over_par': _mean(gir[g][0]), 'putts': _mean(gir[g][1])}
+                         for g in (True, False)],
+        'by_stroke_index': [{'hcp': hcp, 'over_par': _mean(by_hcp[hcp])} for hcp in range(1, 19)],
+    }
+
+
+def same(a, b):
+    """Compare two summaries, allowing for the last rounded digit of averages."""
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) <= 0.011
+    return a == b
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=10000)
+    args = parser.parse_args()
+
+    cards = make_cards(args.cards)
+    expected, python_time = timed(python_summary, cards)
+    matrix, load_time = timed(HoleMatrix.from_cards, cards)
+    result, numpy_time = timed(matrix.summary)
+    assert same(result, expected), 'NumPy and pure-Python results differ'
+    print(f'{args.cards} cartes')
+    print(f'Python pur     : {python_time * 1000:8.1f} ms')
+    print(f'NumPy (calcul) : {numpy_time * 1000:8.1f} ms  (x{python_time / numpy_time:.1f})')
+    print(f'NumPy (chargement des tableaux) : {load_time * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Time the batch scoring functions against the per-card ones.
+
+The cards and both scorers come from tests/scoring_cards.py, where
+tests/test_scoring.py checks that they give exactly the same results.
+Run from the project root:
+
+    python -m benchmarks.bench_scoring --cards 100000
+"""
+import argparse
+import gc
+import time
+
+from scoring import allocation
+from tests.scoring_cards import batch_scores, copy_holes, make_cards, python_scores
+
+
+def timed(func, *args):
+    gc.collect()
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=10000)
+    args = parser.parse_args()
+
+    cards = make_cards(args.cards)
+    _, python_time = timed(python_scores, cards, copy_holes(cards))
+    allocation.cache_clear()
+    _, batch_time = timed(batch_scores, cards, copy_holes(cards))
+    print(f'Fonctions par carte : {python_time * 1000:8.1f} ms')
+    print(f'Calcul par lots     : {batch_time * 1000:8.1f} ms  (x{python_time / batch_time:.1f})')
+    print(f'Tables de répartition : {allocation.cache_info().currsize} pour {args.cards} cartes')
+
+
+if __name__ == '__main__':
+    main()
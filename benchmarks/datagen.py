@@ -0,0 +1,103 @@
+"""Fill the database with seeded synthetic golfs, tours and scorecards.
+
+Cards go through importer.import_cards, so they are scored, stored and
+indexed exactly like imported ones. Run from the project root:
+
+    python -m benchmarks.datagen --cards 10000 --user bench
+"""
+import argparse
+import datetime
+import random
+
+from cache import bump_version
+from models import db, User, Golf
+import importer
+
+PAR_LAYOUT = [3] * 4 + [4] * 10 + [5] * 4
+
+
+def make_golf(rng, number):
+    """Return a Golf with a par 72 layout, a stroke index order and a rating."""
+    pars = PAR_LAYOUT[:]
+    rng.shuffle(pars)
+    return Golf(
+        name=f'Golf {number:03d}',
+        course=rng.choice(('Championnat', 'Parcours A', 'Parcours B')),
+        par=sum(pars),
+        tees=rng.choice(('Jaunes', 'Blancs', 'Bleus', 'Rouges')),
+        slope=rng.randint(113, 145),
+        sss=round(sum(pars) + rng.uniform(-2.5, 3.5), 1),
+        pars=pars,
+        hcps=rng.sample(range(1, 19), 18),
+    )
+
+
+def make_hole(rng, par, handicap):
+    """Return one played hole for a player of the given handicap."""
+    over = max(-1, round(rng.gauss(handicap / 18, 0.9)))
+    putts = rng.choices((0, 1, 2, 3, 4), weights=(2, 25, 55, 15, 3))[0]
+    return {
+        'par': par,
+        'strokes': par + over,
+        'putts': putts,
+        'fairway': par > 3 and rng.random() < 0.7 - handicap / 90,
+        'gir': over - (putts - 2) <= 0 and rng.random() < 0.9,
+    }
+
+
+def make_cards(rng, golfs, count, start=datetime.date(2015, 1, 1), days=3650):
+    """Yield (row number, raw card) pairs in the importer's JSON shape, spread over `days`."""
+    handicap = rng.uniform(5, 30)
+    for n in range(count):
+        golf = rng.choice(golfs)
+        handicap = min(max(handicap + rng.uniform(-0.4, 0.4), 0), 36)
+        playing = round(handicap * golf.slope / 113)
+        yield n + 1, {
+            'name': f'Partie {n + 1}',
+            'jour': n % 4 + 1,
+            'date': (start + datetime.timedelta(days=n * days // count)).isoformat(),
+            'golf_id': golf.id,
+            'handicap': playing,
+            'pcc': rng.choice((0, 0, 0, 0, 1, -1)),
+            'holes': [make_hole(rng, par, playing) for par in golf.pars],
+        }
+
+
+def generate(cards, golfs=20, username='bench', seed=0):
+    """Create the user and golfs if needed, then import `cards` synthetic cards.
+
+    Returns the import report. Calling it again with another seed adds
+    more cards over the same ten years.
+    """
+    rng = random.Random(seed)
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        user = User(username=username)
+        db.session.add(user)
+    existing = Golf.query.order_by(Golf.id).all()
+    new_golfs = [make_golf(rng, number) for number in range(len(existing) + 1, golfs + 1)]
+    db.session.add_all(new_golfs)
+    if new_golfs:
+        bump_version()
+    db.session.commit()
+    return importer.import_cards(make_cards(rng, existing + new_golfs, cards), user.id)
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=1000)
+    parser.add_argument('--golfs', type=int, default=20)
+    parser.add_argument('--user', default='bench')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    with app.app_context():
+        db.create_all()
+        report = generate(args.cards, args.golfs, args.user, args.seed)
+    print(f'{report.imported} cartes créées, {len(report.errors)} erreurs')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""Time every page and the scoring helpers on growing synthetic databases.
+
+For each size the database is filled up to that many cards with
+benchmarks.datagen, then each page is requested through the Flask test
+client. The report gives the median latency with an empty view cache,
+the latency of a cached repeat view, the number of SQL queries and the
+peak Python memory of one request. Run from the project root:
+
+    python -m benchmarks.suite --output benchmarks/baseline.json
+    python -m benchmarks.suite --sizes 100 10000 --compare benchmarks/baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SIZES = (100, 10000, 100000)
+CACHED_ROUTES = ('index', 'list_scores', 'overall_stats')
+
+
+def routes(tour_id, golf_id):
+    """Return (name, method, url) for every page, using `tour_id` for card pages and `golf_id` for course pages."""
+    return [
+        ('index', 'GET', '/'),
+        ('list_scores', 'GET', '/scores'),
+        ('list_scores_diff', 'GET', '/scores?sort=diff'),
+        ('overall_stats', 'GET', '/stats'),
+        ('analytics', 'GET', '/analytics'),
+        ('analytics_json', 'GET', '/analytics.json'),
+        ('view_score', 'GET', f'/view_score/{tour_id}'),
+        ('export_csv', 'GET', '/export/csv'),
+        ('export_holes', 'GET', '/export/holes'),
+        ('export_jsonl', 'GET', '/export/jsonl'),
+        ('manage_golf', 'GET', '/golf'),
+        ('golfs_json', 'GET', '/golfs.json'),
+        ('course_detail', 'GET', f'/golf/{golf_id}'),
+        ('golfs_search', 'GET', '/golfs/search.json?q=go'),
+        ('search', 'GET', '/search?q=t'),
+        ('add_tour', 'GET', f'/add_tour?id={tour_id}'),
+        ('start_score', 'GET', '/start_score'),
+        ('api_tours', 'GET', '/api/v1/tours'),
+        ('api_tours_fields', 'GET', '/api/v1/tours?fields=id,date,diff'),
+        ('add_score_form', 'GET', f'/add_score/{tour_id}'),
+        ('add_score', 'POST', f'/add_score/{tour_id}'),
+    ]
+
+
+def score_form(score):
+    """Return the add_score form data that saves `score` unchanged."""
+    data = {'pcc': score.tour.pcc or 0, 'handicap': score.handicap}
+    for hole in score.holes:
+        i = hole.hole_no
+        data.update({f'par_{i}': hole.par, f'strokes_{i}': hole.strokes,
+                     f'adjusted_{i}': hole.adjusted, f'putts_{i}': hole.putts})
+        if hole.fairway:
+            data[f'fairway_{i}'] = 'on'
+        if hole.gir:
+            data[f'gir_{i}'] = 'on'
+    return data
+
+
+def measure_route(client, view_cache, count_queries, method, url, data, repeat, cached):
+    def call():
+        response = client.open(url, method=method, data=data)
+        response.get_data()
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url}: {response.status_code}')
+
+    cold = []
+    for _ in range(repeat):
+        view_cache.clear()
+        start = time.perf_counter()
+        call()
+        cold.append(time.perf_counter() - start)
+    view_cache.clear()
+    tracemalloc.start()
+    with count_queries() as counter:
+        call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = {
+        'ms': round(statistics.median(cold) * 1000, 2),
+        'queries': counter.count,
+        'peak_kb': round(peak / 1024, 1),
+    }
+    if cached:
+        warm = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            warm.append(time.perf_counter() - start)
+        result['warm_ms'] = round(statistics.median(warm) * 1000, 2)
+    return result
+
+
+def measure_helpers(rows):
+    """Time the per-card handicap allocation and the per-card and batch differentials over every stored card."""
+    from scoring import diff_whs, differentials, distribute_handicap
+
+    results = {}
+    start = time.perf_counter()
+    for handicap, hcps, _, _, _, _ in rows:
+        distribute_handicap(handicap, hcps)
+    elapsed = time.perf_counter() - start
+    results['distribute_handicap'] = {'ms': round(elapsed * 1000, 2),
+                                      'us_per_call': round(elapsed / len(rows) * 1e6, 3)}
+    start = time.perf_counter()
+    for _, _, sba, slope, sss, pcc in rows:
+        diff_whs(sba, slope, sss, pcc)
+    elapsed = time.perf_counter() - start
+    results['diff_whs'] = {'ms': round(elapsed * 1000, 2),
+                           'us_per_call': round(elapsed / len(rows) * 1e6, 3)}
+    _, _, sba, slopes, ssses, pccs = zip(*rows)
+    start = time.perf_counter()
+    differentials(sba, slopes, ssses, [pcc or 0 for pcc in pccs])
+    elapsed = time.perf_counter() - start
+    results['differentials'] = {'ms': round(elapsed * 1000, 2),
+                                'us_per_call': round(elapsed / len(rows) * 1e6, 3)}
+    return results
+
+
+def run(sizes, repeat):
+    from app import create_app
+    from benchmarks.datagen import generate
+    from cache import view_cache
+    from models import db, User, Tour, Score
+    from queries import card_for_tour, count_queries
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    results = {}
+    with app.app_context():
+        db.create_all()
+    for size in sizes:
+        with app.app_context():
+            current = Score.query.count()
+            start = time.perf_counter()
+            if size > current:
+                generate(size - current, seed=size)
+            import_ms = round((time.perf_counter() - start) * 1000, 1)
+            user_id = User.query.filter_by(username='bench').one().id
+            tour_id = db.session.query(db.func.max(Tour.id)).scalar()
+            golf_id = db.session.get(Tour, tour_id).golf_id
+            form = score_form(card_for_tour(tour_id, user_id))
+            helper_rows = (
+                db.session.query(Score.handicap, Tour.hcps, Score.total_sba, Tour.slope, Tour.sss, Tour.pcc)
+                .join(Tour, Score.tour_id == Tour.id).all()
+            )
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+        pages = {}
+        for name, method, url in routes(tour_id, golf_id):
+            data = form if method == 'POST' else None
+            with app.app_context():
+                pages[name] = measure_route(client, view_cache, count_queries, method, url, data, repeat,
+                                            name in CACHED_ROUTES)
+            print(f'{size:>7} {name:<18} {pages[name]["ms"]:>9.1f} ms  {pages[name]["queries"]:>3} requêtes'
+                  f'  {pages[name]["peak_kb"]:>9.0f} Ko', file=sys.stderr)
+        results[str(size)] = {
+            'cards': max(size, current),
+            'generate_ms': import_ms,
+            'routes': pages,
+            'helpers': measure_helpers(helper_rows),
+        }
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Print the latency ratio of each page against a baseline; return the regressions.
+
+    A page regresses when it is both `threshold` times and `min_delta` ms
+    slower, so sub-millisecond noise is not reported.
+    """
+    regressions = []
+    for size, current in results.items():
+        before = baseline.get('sizes', {}).get(size)
+        if not before:
+            continue
+        for kind in ('routes', 'helpers'):
+            for name, values in current[kind].items():
+                old = before[kind].get(name)
+                if not old or not old['ms']:
+                    continue
+                ratio = values['ms'] / old['ms']
+                slower = ratio > threshold and values['ms'] - old['ms'] > min_delta
+                flag = ' <-- régression' if slower else ''
+                print(f'{size:>7} {name:<20} {old["ms"]:>9.1f} -> {values["ms"]:>9.1f} ms  x{ratio:.2f}{flag}')
+                if flag:
+                    regressions.append((size, name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Fichier JSON où écrire les résultats.')
+    parser.add_argument('--compare', help='Fichier JSON de référence à comparer.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Rapport de latence au-delà duquel une page est signalée.')
+    parser.add_argument('--min-delta', type=float, default=2.0,
+                        help='Écart minimal en ms pour signaler une page.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='index-whs-bench-') as workdir:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        os.environ.pop('VIEW_CACHE_PATH', None)
+        report = {
+            'meta': {
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'repeat': args.repeat,
+            },
+            'sizes': run(sorted(args.sizes), args.repeat),
+        }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report['sizes'], baseline, args.threshold, args.min_delta):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
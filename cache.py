@@ -0,0 +1,136 @@
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, DataVersion
+
+GLOBAL_SCOPE = 'global'
+
+
+def _scopes(user_id):
+    return [GLOBAL_SCOPE] if user_id is None else [GLOBAL_SCOPE, f'user:{user_id}']
+
+
+def bump_version(user_id=None):
+    """Record a data change seen by one user, or by everyone when user_id is None.
+
+    The counter is updated in the current transaction, so it is committed
+    together with the change it describes.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    table = DataVersion.__table__
+    stmt = insert(table).values(scope=_scopes(user_id)[-1], value=1, changed_at=now)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.scope],
+        set_={'value': table.c.value + 1, 'changed_at': now},
+    ))
+
+
+def data_version(user_id=None):
+    """Return the data version string and last change time seen by a user."""
+    scopes = _scopes(user_id)
+    rows = {
+        row.scope: row
+        for row in db.session.query(DataVersion.scope, DataVersion.value, DataVersion.changed_at)
+        .filter(DataVersion.scope.in_(scopes))
+    }
+    version = '.'.join(str(rows[s].value) if s in rows else '0' for s in scopes)
+    changes = [rows[s].changed_at for s in scopes if s in rows and rows[s].changed_at]
+    last_modified = max(changes).replace(tzinfo=timezone.utc) if changes else None
+    return version, last_modified
+
+
+class ViewCache:
+    """LRU cache of computed view models, optionally backed by a SQLite file.
+
+    Entries are stored under a scope (page and user) and a data version; a
+    newer version replaces the older entries of its scope in the backing file.
+    """
+
+    def __init__(self, app=None, size=256, path=None):
+        self.size = size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.size = app.config.get('VIEW_CACHE_SIZE', self.size)
+        self.path = app.config.get('VIEW_CACHE_PATH', self.path)
+        app.extensions['view_cache'] = self
+        if self.path:
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode = WAL')
+                conn.execute('CREATE TABLE IF NOT EXISTS view_cache '
+                             '(key TEXT PRIMARY KEY, scope TEXT, version TEXT, value BLOB)')
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_view_cache_scope ON view_cache (scope)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def get(self, scope, version, args=''):
+        key = f'{scope}:{version}:{args}'
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+        value = None
+        if self.path:
+            with self._connect() as conn:
+                row = conn.execute('SELECT value FROM view_cache WHERE key = ?', (key,)).fetchone()
+            if row:
+                value = pickle.loads(row[0])
+                self._remember(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, scope, version, args, value):
+        key = f'{scope}:{version}:{args}'
+        self._remember(key, value)
+        if self.path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM view_cache WHERE scope = ? AND version != ?', (scope, version))
+                conn.execute('INSERT OR REPLACE INTO view_cache (key, scope, version, value) VALUES (?, ?, ?, ?)',
+                             (key, scope, version, pickle.dumps(value)))
+
+    def get_or_build(self, scope, version, args, build):
+        value = self.get(scope, version, args)
+        if value is None:
+            value = build()
+            self.set(scope, version, args, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+        if self.path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM view_cache')
+
+
+view_cache = ViewCache()
@@ -0,0 +1,66 @@
+from typing import NamedTuple
+
+from jinja2.utils import htmlsafe_json_dumps
+
+from cache import data_version, view_cache
+from models import db, Golf
+
+CATALOG_SCOPE = 'courses'
+
+
+class Course(NamedTuple):
+    """Immutable copy of a golf course, safe to share between requests."""
+
+    id: int
+    name: str
+    course: str
+    par: int
+    tees: str
+    slope: int
+    sss: float
+    pars: tuple
+    hcps: tuple
+
+    @property
+    def doc_id(self):
+        """Return id for compatibility with templates expecting doc_id."""
+        return self.id
+
+
+class Catalog(NamedTuple):
+    """Every course of one data version, with its JSON payload serialized once."""
+
+    version: str
+    courses: tuple
+    by_id: dict
+    json: str
+    last_modified: object
+
+    def choices(self):
+        return [(c.id, c.name) for c in self.courses]
+
+
+def load_catalog(version, last_modified=None):
+    """Read every golf course and serialize the fields the tour forms need."""
+    columns = (Golf.id, Golf.name, Golf.course, Golf.par, Golf.tees, Golf.slope, Golf.sss, Golf.pars, Golf.hcps)
+    courses = tuple(
+        Course(*row[:7], tuple(row.pars) if row.pars else None, tuple(row.hcps) if row.hcps else None)
+        for row in db.session.query(*columns).order_by(Golf.id)
+    )
+    payload = [
+        {'id': c.id, 'par': c.par, 'slope': c.slope, 'sss': c.sss, 'pars': c.pars, 'hcps': c.hcps}
+        for c in courses
+    ]
+    # HTML-safe JSON is still valid JSON, so the same string goes in pages and in /golfs.json.
+    json = str(htmlsafe_json_dumps(payload, separators=(',', ':')))
+    return Catalog(version, courses, {c.id: c for c in courses}, json, last_modified)
+
+
+def course_catalog():
+    """Return the course catalog of the current data version.
+
+    Courses are shared by every user, so the catalog follows the global data
+    version that golf writes bump, and is rebuilt only after such a write.
+    """
+    version, last_modified = data_version()
+    return view_cache.get_or_build(CATALOG_SCOPE, version, '', lambda: load_catalog(version, last_modified))
@@ -4,5 +4,39 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key')
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'app.db')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'app.db'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    PAGE_SIZE = 50
+    API_MAX_PAGE_SIZE = 500
+    API_MAX_BATCH = 1000
+    API_COMPRESS_MIN_SIZE = 500
+    JOB_THREADS = int(os.environ.get('JOB_THREADS', 1))
+    JOB_BATCH_SIZE = 200
+    JOB_STALE_SECONDS = 300
+    VIEW_CACHE_SIZE = 256
+    VIEW_CACHE_PATH = os.environ.get('VIEW_CACHE_PATH')
+    # Archive file of old seasons, next to the SQLite database by default.
+    ARCHIVE_PATH = os.environ.get('ARCHIVE_PATH')
+    ARCHIVE_KEEP_SEASONS = int(os.environ.get('ARCHIVE_KEEP_SEASONS', 3))
+    INSTRUMENTATION = os.environ.get('INSTRUMENTATION') == '1'
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+    # Bearer token of the Prometheus scraper; /metrics otherwise needs a login.
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+    }
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    SQLITE_PRAGMAS = {
+        **Config.SQLITE_PRAGMAS,
+        'busy_timeout': 15000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+    }
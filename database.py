@@ -0,0 +1,51 @@
+import os
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+ARCHIVE_SCHEMA = 'archive'
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def setup_sqlite(app):
+    """Tune each SQLite connection of the app with the SQLITE_PRAGMAS setting.
+
+    Transactions are begun explicitly: writing requests, commands and
+    background jobs take the write lock with BEGIN IMMEDIATE, so concurrent
+    writers wait on the busy timeout instead of failing when they upgrade a
+    read transaction.
+
+    When the archive file of old seasons exists (ARCHIVE_PATH, by default
+    the database file with an -archive suffix) it is attached as the
+    `archive` schema: SQLite cannot attach inside a transaction, so it is
+    done when the connection opens, and the pragmas then apply to both files.
+    """
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = app.config.get('SQLITE_PRAGMAS', {})
+    database = engine.url.database
+    if not app.config.get('ARCHIVE_PATH') and database and database != ':memory:':
+        root, ext = os.path.splitext(database)
+        app.config['ARCHIVE_PATH'] = f'{root}-archive{ext or ".db"}'
+    archive_path = app.config.get('ARCHIVE_PATH')
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        if archive_path and os.path.exists(archive_path):
+            cursor.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (archive_path,))
+            connection_record.info[ARCHIVE_SCHEMA] = True
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        writing = request.method not in READ_METHODS if has_request_context() else True
+        conn.exec_driver_sql('BEGIN IMMEDIATE' if writing else 'BEGIN')
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+from itertools import chain, groupby
+
+from archive import archived_cards
+from models import db, Tour, Score, HoleResult
+from queries import filter_rounds
+
+SUMMARY_HEADER = ['Tour', 'Date', 'Total', 'SBA', 'Diff']
+HOLES_HEADER = ['Tour', 'Date', 'Trou', 'Par', 'Coups', 'SBA', 'Coups reçus', 'Fairway', 'GIR', 'Putts']
+FORMATS = {
+    'csv': ('text/csv', 'scores.csv'),
+    'holes': ('text/csv', 'scores_trous.csv'),
+    'jsonl': ('application/x-ndjson', 'scores.jsonl'),
+}
+
+
+def _filtered(query, **filters):
+    return filter_rounds(query.select_from(Score).join(Tour, Score.tour_id == Tour.id), **filters)
+
+
+def _csv_lines(header, rows, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if n % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def summary_csv(batch_size=1000, **filters):
+    query = _filtered(db.session.query(Tour.name, Tour.date, Score.total_strokes, Score.total_sba, Score.diff),
+                      **filters)
+    archived = ((s.tour.name, s.tour.date, s.total_strokes, s.total_sba, s.diff)
+                for s in archived_cards(holes=False, batch_size=batch_size, **filters))
+    rows = (
+        (name, date, total, sba, diff if diff is not None else '')
+        for name, date, total, sba, diff in chain(archived, query.order_by(Score.id).yield_per(batch_size))
+    )
+    return _csv_lines(SUMMARY_HEADER, rows, batch_size)
+
+
+def _hole_rows(batch_size, filters, *columns):
+    query = _filtered(db.session.query(*columns, HoleResult), **filters)
+    query = query.join(HoleResult, HoleResult.score_id == Score.id)
+    return query.order_by(Score.id, HoleResult.hole_no).yield_per(batch_size)
+
+
+def holes_csv(batch_size=1000, **filters):
+    archived = ((s.tour.name, s.tour.date, h) for s in archived_cards(batch_size=batch_size, **filters)
+                for h in s.holes)
+    rows = (
+        (name, date, h.hole_no, h.par, h.strokes, h.adjusted, h.strokes_given,
+         int(bool(h.fairway)), int(bool(h.gir)), h.putts)
+        for name, date, h in chain(archived, _hole_rows(batch_size, filters, Tour.name, Tour.date))
+    )
+    return _csv_lines(HOLES_HEADER, rows, batch_size)
+
+
+def _card_document(score, tour, holes):
+    card = {
+        'name': tour.name,
+        'jour': tour.jour,
+        'date': tour.date.isoformat() if tour.date else None,
+        'golf_id': tour.golf_id,
+        'slope': tour.slope,
+        'sss': tour.sss,
+        'pcc': tour.pcc,
+        'handicap': score.handicap,
+        'total_strokes': score.total_strokes,
+        'total_sba': score.total_sba,
+        'diff': score.diff,
+        'holes': [{key: getattr(h, key) for key in HoleResult.FIELDS} for h in holes],
+    }
+    return json.dumps(card, ensure_ascii=False) + '\n'
+
+
+def cards_jsonl(batch_size=1000, **filters):
+    """Yield one JSON document per card, holes included, archived cards first."""
+    for score in archived_cards(batch_size=batch_size, **filters):
+        if score.holes:
+            yield _card_document(score, score.tour, score.holes)
+    rows = _hole_rows(batch_size, filters, Score, Tour)
+    for _, card_rows in groupby(rows, key=lambda row: row[0].id):
+        card_rows = list(card_rows)
+        score, tour, _ = card_rows[0]
+        yield _card_document(score, tour, [h for _, _, h in card_rows])
+
+
+def export_stream(fmt, **filters):
+    if fmt == 'holes':
+        return holes_csv(**filters)
+    if fmt == 'jsonl':
+        return cards_jsonl(**filters)
+    return summary_csv(**filters)
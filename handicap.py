@@ -0,0 +1,94 @@
+from collections import deque
+from datetime import date
+
+from sqlalchemy import insert
+
+from archive import archived_rounds, season_summaries
+from cache import bump_version
+from models import db, Score, SeasonSummary, Tour, IndexHistory
+
+WINDOW = 20
+BEST = 8
+
+
+def compute_index(diffs):
+    """Return the index for a window of differentials, or None below 8 rounds."""
+    if len(diffs) < BEST:
+        return None
+    best = sorted(diffs)[:BEST]
+    return round(sum(best) / BEST, 1)
+
+
+def _history_order():
+    return IndexHistory.date.desc(), IndexHistory.score_id.desc()
+
+
+def update_index_history(user_id, since=None):
+    """Recompute the index history of a user for rounds played on or after `since`.
+
+    Earlier entries are kept and seed the rolling window, so adding or editing
+    a recent round only touches the rounds that follow it. Without `since`
+    the whole history is rebuilt, archived seasons included.
+    """
+    if user_id is None:
+        return
+    history = IndexHistory.query.filter_by(user_id=user_id)
+    rounds = (
+        db.session.query(Score.id, Tour.date, Score.diff)
+        .join(Tour, Score.tour_id == Tour.id)
+        .filter(Tour.user_id == user_id, Score.diff.is_not(None))
+    )
+    window = deque(maxlen=WINDOW)
+    if since is None:
+        history.delete()
+        archived = season_summaries(user_id)
+    else:
+        history.filter(IndexHistory.date >= since).delete()
+        previous = history.order_by(*_history_order()).limit(WINDOW - 1).all()
+        window.extend(h.diff for h in reversed(previous))
+        rounds = rounds.filter(Tour.date >= since)
+        archived = season_summaries(user_id, date_from=date(since.year, 1, 1))
+    # Rounds without a date come first, as in the date order of SQLite.
+    rounds = sorted(archived_rounds(archived, since) + rounds.all(), key=lambda r: (r[1] or date.min, r[0]))
+    entries = []
+    for score_id, played, diff in rounds:
+        window.append(diff)
+        entries.append({'user_id': user_id, 'score_id': score_id, 'date': played, 'diff': diff,
+                        'value': compute_index(window)})
+    if entries:
+        db.session.execute(insert(IndexHistory.__table__), entries)
+    bump_version(user_id)
+    db.session.commit()
+
+
+def earliest(*dates):
+    """Return the earliest of the given round dates, or None if any is missing."""
+    if any(d is None for d in dates):
+        return None
+    return min(dates)
+
+
+def current_index(user_id):
+    """Return the latest index history entry of a user."""
+    return IndexHistory.query.filter_by(user_id=user_id).order_by(*_history_order()).first()
+
+
+def recent_rounds(user_id):
+    """Return the history entries of the rounds in the current window, latest first."""
+    return (IndexHistory.query.filter_by(user_id=user_id)
+            .order_by(*_history_order()).limit(WINDOW).all())
+
+
+def best_score_ids(entries):
+    """Return the ids of the scores counting towards the index in a window."""
+    best = sorted(entries, key=lambda h: h.diff)[:BEST]
+    return {h.score_id for h in best}
+
+
+def rebuild_all_histories():
+    """Rebuild the index history of every user owning scored rounds, archived or not."""
+    user_ids = [uid for (uid,) in db.session.query(Tour.user_id).filter(Tour.user_id.is_not(None))
+                .union(db.session.query(SeasonSummary.user_id))]
+    for user_id in user_ids:
+        update_index_history(user_id)
+    return len(user_ids)
@@ -0,0 +1,263 @@
+import csv
+import datetime
+import json
+import os
+
+from sqlalchemy import insert
+
+from cache import bump_version
+from catalog import course_catalog
+from handicap import update_index_history
+from models import db, Tour, Score, HoleResult, Stats
+from scoring import card_stats, differentials, score_cards
+from summaries import refresh_course_summaries
+
+TRUE_VALUES = {'1', 'true', 'oui', 'x', 'on', 'yes'}
+# ISO first, then the day-first formats of French spreadsheets and older versions.
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d', '%d/%m/%y')
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.tour_ids = []
+        self.golf_ids = set()
+        self.errors = []
+        # Set when the file itself cannot be read: the cards read before are kept.
+        self.file_error = None
+        self.earliest_date = None
+
+
+def file_error(exc):
+    """Return the message of an error raised while reading an import file."""
+    if isinstance(exc, UnicodeDecodeError):
+        return "le fichier n'est pas encodé en UTF-8"
+    if isinstance(exc, json.JSONDecodeError):
+        return f'JSON invalide ligne {exc.lineno} : {exc.msg}'
+    return f'CSV invalide : {exc}'
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return 'csv' if ext == '.csv' else 'json'
+
+
+def read_cards(stream, fmt):
+    """Yield (row number, raw card) pairs from a CSV or JSON/JSON Lines file."""
+    if fmt == 'csv':
+        for row_no, row in enumerate(csv.DictReader(stream), start=2):
+            card = {key: row.get(key) for key in ('name', 'jour', 'date', 'golf_id', 'handicap', 'pcc', 'slope', 'sss')}
+            card['holes'] = [
+                {key: row.get(f'{key}_{i}') for key in ('par', 'strokes', 'adjusted', 'putts', 'fairway', 'gir')}
+                for i in range(1, 19)
+            ]
+            yield row_no, card
+        return
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        for row_no, card in enumerate(json.loads(first + stream.read()), start=1):
+            yield row_no, card
+        return
+    for row_no, line in enumerate(stream, start=1):
+        if row_no == 1:
+            line = first + line
+        if line.strip():
+            yield row_no, line
+
+
+def _int(value, label, required=True):
+    if value is None or value == '':
+        if required:
+            raise ValueError(f'{label} manquant')
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{label} invalide : {value!r}') from None
+
+
+def _float(value, label):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{label} invalide : {value!r}') from None
+
+
+def parse_date(value):
+    """Return a round date from a date or a string in one of DATE_FORMATS, None when empty."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if value is None or isinstance(value, datetime.date):
+        return value
+    text = str(value).strip().split('T')[0].split(' ')[0]
+    if not text:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'date invalide : {value!r}')
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
+
+
+def prepare_card(raw, golfs):
+    """Validate a raw card and return the rows to insert for it, before scoring."""
+    card = json.loads(raw) if isinstance(raw, str) else raw
+    if not isinstance(card, dict):
+        raise ValueError('carte invalide')
+    golf_id = _int(card.get('golf_id'), 'golf_id')
+    golf = golfs.get(golf_id)
+    if not golf:
+        raise ValueError(f'golf inconnu : {golf_id}')
+    name = card.get('name')
+    if name is not None and not isinstance(name, str):
+        raise ValueError(f'name invalide : {name!r}')
+    if not name or not name.strip():
+        raise ValueError('name manquant')
+    date = parse_date(card.get('date'))
+    if not date:
+        raise ValueError('date manquante')
+    raw_holes = card.get('holes') or []
+    if not isinstance(raw_holes, list):
+        raise ValueError('holes doit être une liste')
+    if len(raw_holes) != 18:
+        raise ValueError(f'{len(raw_holes)} trous au lieu de 18')
+    pars = golf.pars or [4] * 18
+    holes = []
+    for i, (hole, default_par) in enumerate(zip(raw_holes, pars), start=1):
+        if not isinstance(hole, dict):
+            raise ValueError(f'trou {i} invalide')
+        holes.append({
+            'par': _int(hole.get('par'), f'par_{i}', required=False) or default_par,
+            'strokes': _int(hole.get('strokes'), f'strokes_{i}'),
+            'adjusted': _int(hole.get('adjusted'), f'adjusted_{i}', required=False),
+            'fairway': _flag(hole.get('fairway')),
+            'gir': _flag(hole.get('gir')),
+            'putts': _int(hole.get('putts'), f'putts_{i}', required=False),
+        })
+    handicap = _int(card.get('handicap'), 'handicap')
+    hcps = card.get('hcps')
+    if hcps:
+        if not isinstance(hcps, list) or len(hcps) != 18:
+            raise ValueError('hcps doit être une liste de 18 valeurs')
+        hcps = [_int(hcp, f'hcp_{i}') for i, hcp in enumerate(hcps, start=1)]
+        if not all(1 <= hcp <= 18 for hcp in hcps):
+            raise ValueError('hcps doit contenir des valeurs de 1 à 18')
+    else:
+        hcps = golf.hcps or list(range(1, 19))
+    slope = _int(card.get('slope'), 'slope', required=False) or golf.slope
+    sss = card.get('sss')
+    sss = _float(sss, 'sss') if sss not in (None, '') else golf.sss
+    pcc = _int(card.get('pcc'), 'pcc', required=False) or 0
+    return {
+        'tour': {
+            'name': name,
+            'jour': _int(card.get('jour'), 'jour', required=False),
+            'date': date,
+            'golf_id': golf_id,
+            'par': golf.par,
+            'slope': slope,
+            'sss': sss,
+            'pcc': pcc,
+            'pars': [h['par'] for h in holes],
+            'hcps': hcps,
+        },
+        'score': {
+            'handicap': handicap,
+            'total_strokes': sum(h['strokes'] for h in holes),
+        },
+        'holes': holes,
+        'stats': card_stats(holes),
+    }
+
+
+def score_chunk(cards):
+    """Fill the strokes received, adjusted scores, SBA totals and differentials of prepared cards."""
+    score_cards([(card['holes'], card['score']['handicap'], card['tour']['hcps']) for card in cards])
+    rated = []
+    for card in cards:
+        card['score']['total_sba'] = sum(h['adjusted'] or 0 for h in card['holes'])
+        card['score']['diff'] = None
+        if card['tour']['slope'] and card['tour']['sss'] is not None:
+            rated.append(card)
+    if rated:
+        diffs = differentials([card['score']['total_sba'] for card in rated],
+                              [card['tour']['slope'] for card in rated],
+                              [card['tour']['sss'] for card in rated],
+                              [card['tour']['pcc'] for card in rated])
+        for card, diff in zip(rated, diffs.tolist()):
+            card['score']['diff'] = diff
+
+
+def _insert_chunk(cards, user_id):
+    """Insert prepared cards in one transaction and return their tour ids."""
+    tour_ids = db.session.execute(
+        insert(Tour).returning(Tour.id, sort_by_parameter_order=True),
+        [dict(card['tour'], user_id=user_id) for card in cards],
+    ).scalars().all()
+    score_ids = db.session.execute(
+        insert(Score).returning(Score.id, sort_by_parameter_order=True),
+        [dict(card['score'], tour_id=tour_id) for card, tour_id in zip(cards, tour_ids)],
+    ).scalars().all()
+    db.session.execute(insert(HoleResult.__table__), [
+        {'score_id': score_id, 'hole_no': hole_no, **{key: hole[key] for key in HoleResult.FIELDS}}
+        for card, score_id in zip(cards, score_ids)
+        for hole_no, hole in enumerate(card['holes'], start=1)
+    ])
+    db.session.execute(insert(Stats.__table__), [
+        dict(card['stats'], score_id=score_id, tour_id=tour_id)
+        for card, score_id, tour_id in zip(cards, score_ids, tour_ids)
+    ])
+    bump_version(user_id)
+    db.session.commit()
+    return tour_ids
+
+
+def import_cards(rows, user_id, chunk_size=500):
+    """Validate and insert cards in chunked transactions.
+
+    Invalid rows are skipped and reported; valid ones are written with one
+    multi-row INSERT per table and chunk. A file that stops being readable
+    (bad encoding, malformed JSON array or CSV) ends the import with
+    `file_error` set.
+    """
+    golfs = course_catalog().by_id
+    report = ImportReport()
+    chunk = []
+
+    def flush():
+        score_chunk(chunk)
+        report.tour_ids += _insert_chunk(chunk, user_id)
+        report.imported += len(chunk)
+        report.golf_ids.update(card['tour']['golf_id'] for card in chunk)
+        dates = [card['tour']['date'] for card in chunk]
+        if report.earliest_date is not None:
+            dates.append(report.earliest_date)
+        report.earliest_date = min(dates)
+        chunk.clear()
+
+    try:
+        for row_no, raw in rows:
+            try:
+                chunk.append(prepare_card(raw, golfs))
+            except ValueError as exc:
+                report.errors.append((row_no, str(exc)))
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as exc:
+        report.file_error = file_error(exc)
+    if chunk:
+        flush()
+    if report.imported:
+        update_index_history(user_id, report.earliest_date)
+        refresh_course_summaries(user_id, report.golf_ids)
+    return report
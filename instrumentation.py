@@ -0,0 +1,197 @@
+import hmac
+import json
+import pickle
+import threading
+import time
+from collections import defaultdict
+
+from flask import (Response, abort, current_app, g, has_request_context, request, before_render_template,
+                   template_rendered)
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_STATEMENTS = 10
+
+
+class RequestTimings:
+    """Time spent by one request in SQL, deserialization and template rendering."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = []
+        self.deserialize = 0.0
+        self.render = 0.0
+        self.render_started = []
+
+    def header(self, total):
+        return ', '.join([
+            f'sql;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} SQL"',
+            f'deserialize;dur={self.deserialize * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def _current():
+    return g.get('timings') if has_request_context() else None
+
+
+def _add_deserialize(start):
+    timings = _current()
+    if timings is not None:
+        timings.deserialize += time.perf_counter() - start
+
+
+class TimedPickle:
+    """Stand-in for the pickle module that times PickleType loads."""
+
+    dumps = staticmethod(pickle.dumps)
+
+    @staticmethod
+    def loads(data):
+        start = time.perf_counter()
+        try:
+            return pickle.loads(data)
+        finally:
+            _add_deserialize(start)
+
+
+def timed_json_loads(data):
+    """JSON column deserializer that times its work."""
+    start = time.perf_counter()
+    try:
+        return json.loads(data)
+    finally:
+        _add_deserialize(start)
+
+
+class RouteMetrics:
+    """Per-endpoint latency histograms and time totals, for one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.totals = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, endpoint, duration, timings):
+        index = next((i for i, bound in enumerate(BUCKETS) if duration <= bound), len(BUCKETS))
+        with self._lock:
+            self.buckets[endpoint][index] += 1
+            totals = self.totals[endpoint]
+            totals['seconds'] += duration
+            totals['sql_queries'] += timings.sql_count
+            totals['sql_seconds'] += timings.sql_time
+            totals['deserialize_seconds'] += timings.deserialize
+            totals['render_seconds'] += timings.render
+
+    def render(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = ['# TYPE whs_request_duration_seconds histogram']
+        with self._lock:
+            for endpoint, counts in sorted(self.buckets.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'whs_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'whs_request_duration_seconds_sum{{endpoint="{endpoint}"}} {self.totals[endpoint]["seconds"]:.6f}')
+                lines.append(f'whs_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+            for name in ('sql_queries', 'sql_seconds', 'deserialize_seconds', 'render_seconds'):
+                lines.append(f'# TYPE whs_{name}_total counter')
+                for endpoint, totals in sorted(self.totals.items()):
+                    lines.append(f'whs_{name}_total{{endpoint="{endpoint}"}} {totals[name]:g}')
+        return '\n'.join(lines) + '\n'
+
+
+class Instrumentation:
+    """Opt-in request profiling enabled by the INSTRUMENTATION setting.
+
+    Each response gets a Server-Timing header, requests slower than
+    SLOW_REQUEST_MS are logged with their slowest SQL statements, and
+    /metrics exposes per-endpoint histograms to logged-in users, or to a
+    scraper sending the METRICS_TOKEN setting as a bearer token. Must be
+    initialised before the database so JSON columns use the timed
+    deserializer.
+    """
+
+    def __init__(self, app=None):
+        self.metrics = RouteMetrics()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('INSTRUMENTATION'):
+            return
+        app.extensions['instrumentation'] = self
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'json_deserializer': timed_json_loads,
+            **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+        }
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._rendered, app)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start'].pop()
+        timings = _current()
+        if timings is not None:
+            timings.sql_count += 1
+            timings.sql_time += duration
+            timings.statements.append((duration, statement))
+
+    def _before_request(self):
+        g.timings = RequestTimings()
+
+    def _after_request(self, response):
+        timings = g.get('timings')
+        if timings is not None:
+            response.headers['Server-Timing'] = timings.header(time.perf_counter() - timings.start)
+        return response
+
+    def _teardown_request(self, exc):
+        timings = g.pop('timings', None)
+        if timings is None:
+            return
+        duration = time.perf_counter() - timings.start
+        endpoint = request.endpoint or 'unknown'
+        self.metrics.observe(endpoint, duration, timings)
+        if duration * 1000 >= current_app.config.get('SLOW_REQUEST_MS', 500):
+            slowest = sorted(timings.statements, key=lambda s: s[0], reverse=True)[:SLOW_STATEMENTS]
+            current_app.logger.warning(
+                'Requête lente %s %s : %.0f ms (%s)\n%s',
+                request.method, request.full_path.rstrip('?'), duration * 1000, timings.header(duration),
+                '\n'.join(f'  {d * 1000:.1f} ms  {" ".join(statement.split())}' for d, statement in slowest),
+            )
+
+    def _before_render(self, app, template, context, **extra):
+        timings = _current()
+        if timings is not None:
+            timings.render_started.append(time.perf_counter())
+
+    def _rendered(self, app, template, context, **extra):
+        timings = _current()
+        if timings is not None and timings.render_started:
+            timings.render += time.perf_counter() - timings.render_started.pop()
+
+    def _metrics_view(self):
+        token = current_app.config.get('METRICS_TOKEN')
+        sent = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not (token and hmac.compare_digest(sent.encode(), token.encode())):
+            if not current_user.is_authenticated:
+                abort(401)
+        return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,203 @@
+"""Background rescoring of cards after a tour or golf edit.
+
+Edits queue a RecomputeJob row in their own transaction; the jobs are run by
+a thread pool in the web process (JOB_THREADS) or by the recompute-worker
+command. Cards are rescored in batches, each committed with the job's
+progress, so an interrupted job resumes where it stopped and running a job
+twice gives the same cards.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import selectinload
+
+from cache import bump_version
+from handicap import update_index_history
+from models import db, Golf, Tour, Score, Stats, HoleResult, RecomputeJob
+from scoring import card_stats, rescore_cards, update_totals
+from summaries import refresh_course_summaries
+
+ACTIVE = ('pending', 'running')
+KEEP_FINISHED = timedelta(days=7)
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def enqueue_recompute(kind, target_id, user_id=None, old_layout=None):
+    """Queue the rescoring of a tour's card or of every card played on a golf.
+
+    The job is added to the current transaction. A pending job for the same
+    target is reused; for golfs it also collects the previous pars and hcps,
+    so tours still using any of them follow the new layout.
+    """
+    job = RecomputeJob.query.filter_by(kind=kind, target_id=target_id, status='pending').first()
+    if job is None:
+        job = RecomputeJob(kind=kind, target_id=target_id, user_id=user_id, status='pending',
+                           payload={'pars': [], 'hcps': []}, done=0, last_tour_id=0, created_at=_now())
+        db.session.add(job)
+    if old_layout:
+        payload = {key: list(values) for key, values in job.payload.items()}
+        for key in ('pars', 'hcps'):
+            if old_layout.get(key) and old_layout[key] not in payload[key]:
+                payload[key].append(old_layout[key])
+        job.payload = payload
+    job.updated_at = _now()
+    return job
+
+
+def _target_tours(job):
+    if job.kind == 'golf':
+        return Tour.query.filter(Tour.golf_id == job.target_id)
+    return Tour.query.filter(Tour.id == job.target_id)
+
+
+def _claim(job_id, stale_after):
+    """Mark a pending or abandoned job as running; return False if another worker has it."""
+    now = _now()
+    claimed = db.session.execute(
+        update(RecomputeJob)
+        .where(RecomputeJob.id == job_id,
+               or_(RecomputeJob.status == 'pending',
+                   (RecomputeJob.status == 'running') & (RecomputeJob.updated_at < now - stale_after)))
+        .values(status='running', updated_at=now)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def _rescore(tours, golf, payload):
+    """Apply a new golf layout to a batch of tours and rescore their cards together."""
+    cards = []
+    for tour in tours:
+        if golf is not None:
+            if golf.pars and tour.pars in payload['pars']:
+                tour.pars = golf.pars
+            if golf.hcps and tour.hcps in payload['hcps']:
+                tour.hcps = golf.hcps
+        score = tour.score
+        if score is not None and len(score.holes) == 18:
+            holes = [{key: getattr(hole, key) for key in HoleResult.FIELDS} for hole in score.holes]
+            cards.append((tour, score, holes))
+    rescore_cards([(holes, score.handicap, tour.hcps or list(range(1, 19)), tour.pars)
+                   for tour, score, holes in cards])
+    for tour, score, holes in cards:
+        score.set_holes(holes)
+        if score.stats is None:
+            score.stats = Stats(score_id=score.id, tour_id=tour.id)
+        for key, value in card_stats(holes).items():
+            setattr(score.stats, key, value)
+    update_totals([(score, tour) for tour, score, _ in cards])
+
+
+def run_job(job, batch_size=200):
+    """Rescore the cards of a claimed job in batches, recording progress after each one."""
+    golf = db.session.get(Golf, job.target_id) if job.kind == 'golf' else None
+    if job.total is None:
+        job.total = _target_tours(job).count()
+        db.session.commit()
+    while True:
+        tours = (_target_tours(job).filter(Tour.id > job.last_tour_id)
+                 .options(selectinload(Tour.score).selectinload(Score.holes),
+                          selectinload(Tour.score).joinedload(Score.stats))
+                 .order_by(Tour.id).limit(batch_size).all())
+        if not tours:
+            break
+        _rescore(tours, golf, job.payload)
+        for user_id in {tour.user_id for tour in tours}:
+            bump_version(user_id)
+        job.done += len(tours)
+        job.last_tour_id = tours[-1].id
+        job.updated_at = _now()
+        db.session.commit()
+    # Differentials may have changed: replay each owner's index history from the earliest card.
+    owners = (_target_tours(job).with_entities(Tour.user_id, func.min(Tour.date))
+              .filter(Tour.user_id.is_not(None)).group_by(Tour.user_id).all())
+    for user_id, since in owners:
+        update_index_history(user_id, since)
+    played = (_target_tours(job).with_entities(Tour.user_id, Tour.golf_id)
+              .filter(Tour.user_id.is_not(None)).distinct().all())
+    for user_id in {user_id for user_id, _ in played}:
+        refresh_course_summaries(user_id, [golf_id for owner, golf_id in played if owner == user_id])
+    job.status = 'done'
+    job.updated_at = _now()
+    db.session.commit()
+
+
+def run_pending(batch_size=200, stale_after=timedelta(minutes=5)):
+    """Run every pending job, and running jobs whose worker stopped; return how many ran."""
+    RecomputeJob.query.filter(RecomputeJob.status == 'done',
+                              RecomputeJob.updated_at < _now() - KEEP_FINISHED).delete()
+    db.session.commit()
+    ran = 0
+    while True:
+        job_ids = [job_id for (job_id,) in db.session.query(RecomputeJob.id).filter(
+            or_(RecomputeJob.status == 'pending',
+                (RecomputeJob.status == 'running') & (RecomputeJob.updated_at < _now() - stale_after))
+        ).order_by(RecomputeJob.id)]
+        db.session.commit()
+        claimed = [job_id for job_id in job_ids if _claim(job_id, stale_after)]
+        if not claimed:
+            return ran
+        for job_id in claimed:
+            job = db.session.get(RecomputeJob, job_id)
+            try:
+                run_job(job, batch_size)
+            except Exception as exc:
+                db.session.rollback()
+                job = db.session.get(RecomputeJob, job_id)
+                job.status = 'failed'
+                job.error = str(exc)
+                job.updated_at = _now()
+                db.session.commit()
+                current_app.logger.exception('Échec du recalcul %s %s', job.kind, job.target_id)
+            ran += 1
+
+
+def active_jobs(user_id):
+    """Return the queued or running jobs started by a user, oldest first."""
+    return (RecomputeJob.query.filter(RecomputeJob.user_id == user_id, RecomputeJob.status.in_(ACTIVE))
+            .order_by(RecomputeJob.id).all())
+
+
+class JobRunner:
+    """Thread pool running queued jobs in the web process.
+
+    With JOB_THREADS set to 0 jobs only run in `flask recompute-worker`.
+    """
+
+    def __init__(self, app=None, threads=1):
+        self.threads = threads
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threads = app.config.get('JOB_THREADS', self.threads)
+        app.extensions['job_runner'] = self
+
+    def wake(self):
+        """Start running the pending jobs in the background."""
+        if not self.threads:
+            return
+        app = current_app._get_current_object()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='recompute')
+        self._executor.submit(self._run, app)
+
+    def _run(self, app):
+        with app.app_context():
+            try:
+                run_pending(app.config.get('JOB_BATCH_SIZE', 200),
+                            timedelta(seconds=app.config.get('JOB_STALE_SECONDS', 300)))
+            except Exception:
+                app.logger.exception('Échec des recalculs en arrière-plan')
+
+
+job_runner = JobRunner()
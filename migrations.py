@@ -0,0 +1,422 @@
+import json
+import os
+import pickle
+from datetime import datetime, timezone
+
+from sqlalchemy import func, inspect, insert, select, text, update
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import joinedload, selectinload
+
+from archive import archived_holes, archived_scores, archived_stats, archived_tours
+from cache import bump_version
+from database import ARCHIVE_SCHEMA
+from handicap import rebuild_all_histories, update_index_history
+from models import db, User, Golf, Tour, Score, Stats, HoleResult, IndexHistory, CourseSummary, MigrationCheckpoint
+from scoring import update_totals
+from importer import parse_date
+from search import create_search_index, rebuild_search_index
+from summaries import rebuild_all_course_summaries, refresh_course_summaries
+
+
+# Single-column indexes replaced by the per-user ones: they only helped
+# queries over every user's rounds.
+OBSOLETE_INDEXES = ('ix_tour_date', 'ix_score_total_strokes', 'ix_score_total_sba', 'ix_score_diff')
+
+
+def add_missing_columns():
+    """Add columns and indexes declared on the models but missing in the database, drop obsolete indexes."""
+    with db.engine.begin() as conn:
+        # Inspect through the same connection: a second one would wait for this write lock.
+        inspector = inspect(conn)
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+
+# Round tables and their archived copies: ids are never reused, so an
+# archived round cannot be overwritten by a later one.
+AUTOINCREMENT_TABLES = (
+    (Tour.__table__, archived_tours),
+    (Score.__table__, archived_scores),
+    (HoleResult.__table__, archived_holes),
+    (Stats.__table__, archived_stats),
+)
+
+
+def use_autoincrement():
+    """Rebuild the round tables created without AUTOINCREMENT and return their names.
+
+    SQLite cannot add it to an existing table, so the rows are copied to a
+    new one, which replaces the old table and gets its indexes back. The id
+    sequence starts above the ids of both the hot and the archived rows.
+    """
+    rebuilt = []
+    with db.engine.begin() as conn:
+        attached = conn.info.get(ARCHIVE_SCHEMA, False)
+        for table, archived in AUTOINCREMENT_TABLES:
+            schema = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                  {'name': table.name}).scalar()
+            if not schema or 'AUTOINCREMENT' in schema.upper():
+                continue
+            create = str(CreateTable(table).compile(dialect=conn.dialect))
+            conn.execute(text(create.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {table.name}_new ', 1)))
+            columns = ', '.join(table.c.keys())
+            conn.execute(text(f'INSERT INTO {table.name}_new ({columns}) SELECT {columns} FROM {table.name}'))
+            # Dropping the table also drops its indexes and search triggers, created again below.
+            conn.execute(text(f'DROP TABLE {table.name}'))
+            conn.execute(text(f'ALTER TABLE {table.name}_new RENAME TO {table.name}'))
+            for index in table.indexes:
+                index.create(conn)
+            top = conn.execute(select(func.max(archived.c.id))).scalar() if attached else None
+            if top:
+                conn.execute(text('DELETE FROM sqlite_sequence WHERE name = :name AND seq < :top'),
+                             {'name': table.name, 'top': top})
+                conn.execute(text('INSERT INTO sqlite_sequence (name, seq) SELECT :name, :top '
+                                  'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)'),
+                             {'name': table.name, 'top': top})
+            rebuilt.append(table.name)
+        if rebuilt:
+            create_search_index(conn)
+    return rebuilt
+
+
+PICKLED_COLUMNS = (('golf', 'pars'), ('golf', 'hcps'), ('tour', 'pars'), ('tour', 'hcps'))
+
+
+def convert_pickled_columns(chunk_size=500):
+    """Rewrite pickled pars/hcps values as JSON so they can be read outside Python."""
+    for table, column in PICKLED_COLUMNS:
+        last_id = 0
+        while True:
+            with db.engine.begin() as conn:
+                rows = conn.execute(text(
+                    f"SELECT id, {column} FROM {table} "
+                    f"WHERE id > :last_id AND typeof({column}) = 'blob' ORDER BY id LIMIT :limit"
+                ), {'last_id': last_id, 'limit': chunk_size}).all()
+                if not rows:
+                    break
+                conn.execute(
+                    text(f'UPDATE {table} SET {column} = :value WHERE id = :id'),
+                    [{'id': row.id, 'value': json.dumps(pickle.loads(row[1]))} for row in rows],
+                )
+            last_id = rows[-1].id
+
+
+def migrate_pickled_holes(chunk_size=500):
+    """Move pickled score holes into the hole_result table, one chunk per transaction."""
+    moved = 0
+    while True:
+        rows = db.session.execute(
+            select(Score.id, Score.legacy_holes)
+            .where(Score.legacy_holes.is_not(None))
+            .order_by(Score.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        hole_rows = [
+            {'score_id': score_id, 'hole_no': hole_no, **{key: hole.get(key) for key in HoleResult.FIELDS}}
+            for score_id, holes in rows
+            for hole_no, hole in enumerate(holes, start=1)
+        ]
+        if hole_rows:
+            db.session.execute(insert(HoleResult.__table__), hole_rows)
+        db.session.execute(
+            update(Score).where(Score.id.in_([r.id for r in rows])).values(legacy_holes=None)
+        )
+        db.session.commit()
+        moved += len(rows)
+    return moved
+
+
+def backfill_score_totals(chunk_size=500):
+    """Fill stored totals and differentials for scores saved before they existed."""
+    last_id = 0
+    updated = 0
+    while True:
+        scores = (Score.query.filter(Score.id > last_id, Score.total_strokes.is_(None))
+                  .options(joinedload(Score.tour), selectinload(Score.holes))
+                  .order_by(Score.id).limit(chunk_size).all())
+        if not scores:
+            break
+        update_totals([(score, score.tour) for score in scores])
+        db.session.commit()
+        last_id = scores[-1].id
+        updated += len(scores)
+    return updated
+
+
+def normalize_tour_dates(chunk_size=500):
+    """Rewrite round dates stored in other formats as ISO dates; return the ids of their owners.
+
+    Dates are stored as 'YYYY-MM-DD' text, so only rows that do not look like
+    one are read. Unreadable dates become NULL.
+    """
+    owners = set()
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, user_id, date FROM tour WHERE id > :last_id AND date IS NOT NULL "
+            "AND (typeof(date) != 'text' OR date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-1][0-9]-[0-3][0-9]') "
+            "ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': chunk_size}).all()
+        if not rows:
+            break
+        values = []
+        for row in rows:
+            date = _date_or_none(row.date)
+            values.append({'id': row.id, 'date': date.isoformat() if date else None})
+            owners.add(row.user_id)
+        db.session.execute(text('UPDATE tour SET date = :date WHERE id = :id'), values)
+        db.session.commit()
+        last_id = rows[-1].id
+    owners.discard(None)
+    return owners
+
+
+def assign_orphan_tours(user_id):
+    """Give the tours without an owner (imported from TinyDB) to a user; return their number."""
+    assigned = Tour.query.filter(Tour.user_id.is_(None)).update({Tour.user_id: user_id})
+    db.session.commit()
+    if assigned:
+        update_index_history(user_id)
+        refresh_course_summaries(user_id)
+    return assigned
+
+
+def assign_orphans_to_only_user():
+    """Give the tours without an owner to the only user, when there is exactly one; return their number."""
+    users = User.query.limit(2).all()
+    if len(users) != 1:
+        return 0
+    return assign_orphan_tours(users[0].id)
+
+
+def upgrade_database():
+    """Create missing tables and columns, then backfill derived data."""
+    db.create_all()
+    add_missing_columns()
+    use_autoincrement()
+    convert_pickled_columns()
+    migrate_pickled_holes()
+    # Before anything loads tours: their dates are read as Date values.
+    redated = normalize_tour_dates()
+    updated = backfill_score_totals()
+    # The index history and the summaries copy round dates.
+    for user_id in redated:
+        update_index_history(user_id)
+        refresh_course_summaries(user_id)
+    assign_orphans_to_only_user()
+    if not IndexHistory.query.first():
+        rebuild_all_histories()
+    if not CourseSummary.query.first():
+        rebuild_all_course_summaries()
+    if updated:
+        bump_version()
+    # The checks above opened a write transaction: release the database lock.
+    db.session.commit()
+    return updated
+
+
+TINYDB_SOURCE = 'tinydb'
+
+
+def _golf_row(doc_id, g):
+    return {'id': doc_id, 'name': g.get('name'), 'course': g.get('course'), 'par': g.get('par'),
+            'slope': g.get('slope'), 'sss': g.get('sss'), 'tees': g.get('tees'),
+            'pars': g.get('pars'), 'hcps': g.get('hcps')}
+
+
+def _date_or_none(value):
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def _tour_row(doc_id, t):
+    return {'id': doc_id, 'name': t.get('name'), 'jour': t.get('jour'), 'date': _date_or_none(t.get('date')),
+            'golf_id': t.get('golf_id'), 'par': t.get('par'), 'slope': t.get('slope'), 'sss': t.get('sss'),
+            'pcc': t.get('pcc', 0), 'pars': t.get('pars'), 'hcps': t.get('hcps')}
+
+
+def _score_row(doc_id, s):
+    return {'id': doc_id, 'tour_id': s.get('tour_id'), 'handicap': s.get('handicap'), 'holes': s.get('holes')}
+
+
+def _stats_row(doc_id, st):
+    return {'id': doc_id, 'score_id': st.get('score_id'), 'tour_id': st.get('tour_id'),
+            'fairway_hits': st.get('fairway_hits'), 'fairway_possible': st.get('fairway_possible'),
+            'gir_hits': st.get('gir_hits'), 'putts_total': st.get('putts_total'), 'putts_avg': st.get('putts_avg')}
+
+
+# TinyDB table name -> (SQL table, row builder).
+TINYDB_TABLES = {
+    'golfs': (Golf.__table__, _golf_row),
+    'tours': (Tour.__table__, _tour_row),
+    'scores': (Score.__table__, _score_row),
+    'stats': (Stats.__table__, _stats_row),
+}
+
+
+class _JSONStream:
+    """Read JSON tokens and small values from a file without loading it whole."""
+
+    def __init__(self, f, buffer_size):
+        self.file = f
+        self.buffer_size = buffer_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        data = self.file.read(self.buffer_size)
+        if not data:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+
+    def peek(self):
+        """Return the next non-blank character, or '' at the end of the file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f'JSON invalide : {chars!r} attendu, {char!r} trouvé')
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next string or object, reading more of the file until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+
+
+def iter_tinydb(path, buffer_size=1 << 16):
+    """Yield (table, doc_id, document) from a TinyDB JSON file, one document at a time."""
+    with open(path, encoding='utf-8') as f:
+        stream = _JSONStream(f, buffer_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            table = stream.value()
+            stream.expect(':')
+            stream.expect('{')
+            if stream.peek() != '}':
+                while True:
+                    doc_id = stream.value()
+                    stream.expect(':')
+                    yield table, int(doc_id), stream.value()
+                    if stream.expect(',}') == '}':
+                        break
+            else:
+                stream.expect('}')
+            if stream.expect(',}') == '}':
+                return
+
+
+def tinydb_path():
+    return os.path.join(os.path.dirname(__file__), 'db.json')
+
+
+def tinydb_pending(path=None):
+    """Return True if a TinyDB file exists and its migration has not finished."""
+    checkpoint = db.session.get(MigrationCheckpoint, TINYDB_SOURCE)
+    return os.path.exists(path or tinydb_path()) and not (checkpoint and checkpoint.finished)
+
+
+def migrate_from_tinydb(path=None, chunk_size=1000, progress=None):
+    """Import a TinyDB file into an empty database; return the number of documents written.
+
+    The file is parsed as a stream and written with one multi-row INSERT per
+    chunk; each chunk is committed with the number of documents done per
+    table in a checkpoint row, so an interrupted migration resumes after the
+    last committed chunk (earlier documents are parsed again but not
+    written). `progress(table, done)` is called after each chunk. Once
+    finished, the tours go to the only user if there is exactly one, with
+    their index history and course summaries.
+    """
+    path = path or tinydb_path()
+    if not os.path.exists(path):
+        return 0
+    db.create_all()
+    checkpoint = db.session.get(MigrationCheckpoint, TINYDB_SOURCE)
+    if checkpoint is None:
+        if Tour.query.first():
+            return 0
+        checkpoint = MigrationCheckpoint(source=TINYDB_SOURCE, positions={})
+        db.session.add(checkpoint)
+        db.session.commit()
+    elif checkpoint.finished:
+        return 0
+
+    positions = dict(checkpoint.positions)
+    seen = {}
+    chunk = []
+    written = 0
+
+    def flush(table):
+        nonlocal written
+        sql_table, _ = TINYDB_TABLES[table]
+        # OR REPLACE keeps the ids of the TinyDB documents, like a merge.
+        db.session.execute(insert(sql_table).prefix_with('OR REPLACE'), chunk)
+        positions[table] = positions.get(table, 0) + len(chunk)
+        checkpoint.positions = dict(positions)
+        checkpoint.updated_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        db.session.commit()
+        written += len(chunk)
+        chunk.clear()
+        if progress:
+            progress(table, positions[table])
+
+    current = None
+    for table, doc_id, document in iter_tinydb(path):
+        if table not in TINYDB_TABLES:
+            continue
+        if table != current and chunk:
+            flush(current)
+        current = table
+        seen[table] = seen.get(table, 0) + 1
+        if seen[table] <= positions.get(table, 0):
+            continue
+        chunk.append(TINYDB_TABLES[table][1](doc_id, document))
+        if len(chunk) >= chunk_size:
+            flush(table)
+    if chunk:
+        flush(current)
+
+    bump_version()
+    db.session.commit()
+    migrate_pickled_holes()
+    backfill_score_totals()
+    rebuild_all_histories()
+    # INSERT OR REPLACE does not run the delete triggers of replaced rows.
+    rebuild_search_index()
+    checkpoint.finished = True
+    db.session.commit()
+    assign_orphans_to_only_user()
+    return written
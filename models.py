@@ -1,6 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 
+from instrumentation import TimedPickle
+
 
 db = SQLAlchemy()
 
@@ -23,8 +25,8 @@ class Golf(db.Model):
     slope = db.Column(db.Integer)
     sss = db.Column(db.Float)
     tees = db.Column(db.String(20))
-    pars = db.Column(db.PickleType)
-    hcps = db.Column(db.PickleType)
+    pars = db.Column(db.JSON)
+    hcps = db.Column(db.JSON)
 
     @property
     def doc_id(self):
@@ -36,18 +38,26 @@ class Tour(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80))
     jour = db.Column(db.Integer)
-    date = db.Column(db.String(20))
+    date = db.Column(db.Date)
     golf_id = db.Column(db.Integer, db.ForeignKey('golf.id'))
     par = db.Column(db.Integer)
     slope = db.Column(db.Integer)
     sss = db.Column(db.Float)
     pcc = db.Column(db.Integer, default=0)
-    pars = db.Column(db.PickleType)
-    hcps = db.Column(db.PickleType)
+    pars = db.Column(db.JSON)
+    hcps = db.Column(db.JSON)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
     golf = db.relationship('Golf')
     user = db.relationship('User')
+    score = db.relationship('Score', uselist=False, back_populates='tour')
+
+    __table_args__ = (
+        db.Index('ix_tour_user_date', 'user_id', 'date'),
+        db.Index('ix_tour_user_golf', 'user_id', 'golf_id'),
+        # Ids of deleted or archived rounds are never handed out again.
+        {'sqlite_autoincrement': True},
+    )
 
     @property
     def doc_id(self):
@@ -57,24 +67,159 @@ class Tour(db.Model):
 
 class Score(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    tour_id = db.Column(db.Integer, db.ForeignKey('tour.id'))
+    tour_id = db.Column(db.Integer, db.ForeignKey('tour.id'), index=True)
     handicap = db.Column(db.Integer)
-    holes = db.Column(db.PickleType)
+    legacy_holes = db.Column('holes', db.PickleType(pickler=TimedPickle))
+    total_strokes = db.Column(db.Integer)
+    total_sba = db.Column(db.Integer)
+    diff = db.Column(db.Float)
 
-    tour = db.relationship('Tour')
+    tour = db.relationship('Tour', back_populates='score')
+    stats = db.relationship('Stats', uselist=False)
+    holes = db.relationship('HoleResult', order_by='HoleResult.hole_no', cascade='all, delete-orphan')
+
+    __table_args__ = {'sqlite_autoincrement': True}
 
     @property
     def doc_id(self):
         """Return id for compatibility with templates expecting doc_id."""
         return self.id
 
+    def set_holes(self, holes):
+        """Update the hole results from a list of 18 hole dicts."""
+        existing = {h.hole_no: h for h in self.holes}
+        for hole_no, data in enumerate(holes, start=1):
+            hole = existing.get(hole_no)
+            if hole is None:
+                hole = HoleResult(hole_no=hole_no)
+                self.holes.append(hole)
+            for key in HoleResult.FIELDS:
+                setattr(hole, key, data.get(key))
+
+
+class HoleResult(db.Model):
+    FIELDS = ('par', 'strokes', 'adjusted', 'strokes_given', 'fairway', 'gir', 'putts')
+
+    id = db.Column(db.Integer, primary_key=True)
+    score_id = db.Column(db.Integer, db.ForeignKey('score.id'), nullable=False)
+    hole_no = db.Column(db.Integer, nullable=False)
+    par = db.Column(db.Integer)
+    strokes = db.Column(db.Integer)
+    adjusted = db.Column(db.Integer)
+    strokes_given = db.Column(db.Integer)
+    fairway = db.Column(db.Boolean)
+    gir = db.Column(db.Boolean)
+    putts = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_hole_result_score_hole', 'score_id', 'hole_no', unique=True),
+        {'sqlite_autoincrement': True},
+    )
+
 
 class Stats(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    score_id = db.Column(db.Integer, db.ForeignKey('score.id'))
-    tour_id = db.Column(db.Integer)
+    score_id = db.Column(db.Integer, db.ForeignKey('score.id'), index=True)
+    tour_id = db.Column(db.Integer, index=True)
     fairway_hits = db.Column(db.Integer)
     fairway_possible = db.Column(db.Integer)
     gir_hits = db.Column(db.Integer)
     putts_total = db.Column(db.Integer)
     putts_avg = db.Column(db.String(10))
+
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+class IndexHistory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    score_id = db.Column(db.Integer)
+    date = db.Column(db.Date)
+    diff = db.Column(db.Float)
+    value = db.Column(db.Float)
+
+    __table_args__ = (db.Index('ix_index_history_user_date', 'user_id', 'date', 'score_id'),)
+
+
+class CourseSummary(db.Model):
+    """A user's results on one golf, kept up to date when their cards change."""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    golf_id = db.Column(db.Integer, primary_key=True)
+    rounds = db.Column(db.Integer, nullable=False)
+    best_strokes = db.Column(db.Integer)
+    avg_strokes = db.Column(db.Float)
+    best_sba = db.Column(db.Integer)
+    avg_sba = db.Column(db.Float)
+    best_diff = db.Column(db.Float)
+    avg_diff = db.Column(db.Float)
+    best_tour_id = db.Column(db.Integer)
+    last_played = db.Column(db.Date)
+    hole_over_par = db.Column(db.JSON)
+    hole_putts = db.Column(db.JSON)
+
+
+class SeasonSummary(db.Model):
+    """Sums of a user's archived rounds for one season and golf.
+
+    `holes` holds per hole the sums and counts of strokes over par, putts and
+    greens in regulation; `diffs` the [date, score id, differential] of each
+    round, in date order, for the index history and the charts.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False)
+    golf_id = db.Column(db.Integer)
+    cards = db.Column(db.Integer, nullable=False)
+    strokes = db.Column(db.Integer, nullable=False)
+    sba = db.Column(db.Integer, nullable=False)
+    diff_sum = db.Column(db.Float, nullable=False)
+    diff_count = db.Column(db.Integer, nullable=False)
+    putts = db.Column(db.Integer, nullable=False)
+    fairway_hits = db.Column(db.Integer, nullable=False)
+    fairway_possible = db.Column(db.Integer, nullable=False)
+    gir_hits = db.Column(db.Integer, nullable=False)
+    best_strokes = db.Column(db.Integer)
+    best_sba = db.Column(db.Integer)
+    best_diff = db.Column(db.Float)
+    best_tour_id = db.Column(db.Integer)
+    last_played = db.Column(db.Date)
+    holes = db.Column(db.JSON)
+    diffs = db.Column(db.JSON)
+
+    __table_args__ = (db.Index('ix_season_summary_user_season', 'user_id', 'season', 'golf_id'),)
+
+
+class DataVersion(db.Model):
+    scope = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime)
+
+
+class MigrationCheckpoint(db.Model):
+    """Progress of a data migration: documents committed per source table."""
+
+    source = db.Column(db.String(40), primary_key=True)
+    positions = db.Column(db.JSON, nullable=False)
+    finished = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime)
+
+
+class RecomputeJob(db.Model):
+    """Queued rescoring of the cards of a tour or a golf after an edit."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    total = db.Column(db.Integer)
+    done = db.Column(db.Integer, nullable=False, default=0)
+    last_tour_id = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_recompute_job_status', 'status', 'kind', 'target_id'),)
@@ -0,0 +1,261 @@
+import base64
+import binascii
+import json
+import re
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import Date, Integer, and_, cast, event, func, null, or_, select, union_all
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+
+from models import db, Tour, Score, HoleResult, SeasonSummary, Stats
+
+PERIODS = {'year': '%Y', 'month': '%Y-%m'}
+# Tables that grow with each user's history must be read through a user,
+# tour, score or row id, never scanned or searched on another column.
+UNSCOPED_READ = re.compile(
+    r'(SCAN|SEARCH) (tour|score|stats|hole_result|index_history|course_summary|season_summary)(_\d+)?\b(?!.*\((user_id|tour_id|score_id|rowid)=)'
+)
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, date):
+        value = value.isoformat()
+    payload = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    return value, row_id
+
+
+def keyset_page(query, load, column, id_column, key, cursor=None, size=50, descending=False):
+    """Return a page of `query` ordered by (column, id) and the cursor of the next page.
+
+    Pages are located with a WHERE clause on the last row seen instead of an
+    OFFSET, so every page costs an index range scan. Rows whose `column` is
+    NULL come after all the others: the ids of the page are picked from both
+    segments by two limited subqueries of the filtered `query`, and `load`
+    reads those rows by id with its loader options, so a page is always one
+    query whatever the data. `key` returns the (value, id) of a row.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    value, last_id = after or (None, None)
+    if isinstance(column.type, Date) and isinstance(value, str):
+        try:
+            value = date.fromisoformat(value)
+        except ValueError:
+            after, value, last_id = None, None, None
+    order = (column.desc(), id_column.desc()) if descending else (column, id_column)
+
+    def beyond(col, bound):
+        return col < bound if descending else col > bound
+
+    ids = query.with_entities(id_column).order_by(None)
+    segments = []
+    if value is not None or after is None:
+        page = ids.filter(column.is_not(None))
+        if after:
+            page = page.filter(or_(beyond(column, value), and_(column == value, beyond(id_column, last_id))))
+        segments.append(page.order_by(*order).limit(size + 1).subquery())
+    page = ids.filter(column.is_(None))
+    if after and value is None:
+        page = page.filter(beyond(id_column, last_id))
+    segments.append(page.order_by(order[1]).limit(size + 1).subquery())
+    page_ids = union_all(*(select(segment.c[0]) for segment in segments))
+    rows = (load.filter(id_column.in_(page_ids))
+            .order_by(column.is_(None), *order).limit(size + 1).all())
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(*key(rows[-1]))
+    return rows, next_cursor
+
+
+def tours_page(user_id, cursor=None, size=50, holes=False, stats=False, golf_id=None, date_from=None, date_to=None):
+    """Return a page of a user's tours, latest first, with their score preloaded.
+
+    `holes` and `stats` also preload the hole results and stats of the scores.
+    """
+    query = filter_rounds(Tour.query, user_id, golf_id, date_from, date_to)
+    load = Tour.query.options(*tour_loads(holes, stats))
+    return keyset_page(query, load, Tour.date, Tour.id, lambda t: (t.date, t.id), cursor, size, descending=True)
+
+
+def tour_loads(holes=False, stats=False):
+    """Return the loader options of a tour's score and, on demand, its holes and stats."""
+    options = [selectinload(Tour.score)]
+    if holes:
+        options.append(selectinload(Tour.score).selectinload(Score.holes))
+    if stats:
+        options.append(selectinload(Tour.score).joinedload(Score.stats))
+    return options
+
+
+def cards_page(user_id, sort='date', golf_id=None, cursor=None, size=50, date_from=None, date_to=None):
+    """Return a page of a user's scores sorted by round date or differential."""
+    query = filter_rounds(Score.query.join(Score.tour), user_id, golf_id, date_from, date_to)
+    load = Score.query.join(Score.tour).options(contains_eager(Score.tour))
+    if sort == 'diff':
+        return keyset_page(query, load, Score.diff, Score.id, lambda s: (s.diff, s.id), cursor, size)
+    return keyset_page(query, load, Tour.date, Score.id, lambda s: (s.tour.date, s.id), cursor, size)
+
+
+def card_for_tour(tour_id, user_id):
+    """Return the score of a user's tour with its tour, holes and stats loaded."""
+    return (Score.query.join(Score.tour)
+            .filter(Score.tour_id == tour_id, Tour.user_id == user_id)
+            .options(contains_eager(Score.tour), joinedload(Score.stats), selectinload(Score.holes))
+            .first())
+
+
+def filter_rounds(query, user_id, golf_id=None, date_from=None, date_to=None):
+    """Restrict a query joined to Tour to a user's rounds, a golf and a date range."""
+    query = query.filter(Tour.user_id == user_id)
+    if golf_id:
+        query = query.filter(Tour.golf_id == golf_id)
+    if date_from:
+        query = query.filter(Tour.date >= date_from)
+    if date_to:
+        query = query.filter(Tour.date <= date_to)
+    return query
+
+
+def card_aggregates(group_by=None, **filters):
+    """Return card counts and sums of scores and stats, optionally grouped.
+
+    Each row has `key` (the group value, or None), `cards`, `strokes`, `sba`,
+    `diff` (average) and `diff_count`, `putts`, `fairway_hits`,
+    `fairway_possible` and `gir_hits`.
+    """
+    key = group_by if group_by is not None else null()
+    query = (
+        db.session.query(
+            key.label('key'),
+            func.count(Score.id).label('cards'),
+            func.coalesce(func.sum(Score.total_strokes), 0).label('strokes'),
+            func.coalesce(func.sum(Score.total_sba), 0).label('sba'),
+            func.avg(Score.diff).label('diff'),
+            func.count(Score.diff).label('diff_count'),
+            func.coalesce(func.sum(Stats.putts_total), 0).label('putts'),
+            func.coalesce(func.sum(Stats.fairway_hits), 0).label('fairway_hits'),
+            func.coalesce(func.sum(Stats.fairway_possible), 0).label('fairway_possible'),
+            func.coalesce(func.sum(Stats.gir_hits), 0).label('gir_hits'),
+        )
+        .select_from(Score)
+        .join(Tour, Score.tour_id == Tour.id)
+        .join(Stats, Stats.score_id == Score.id)
+    )
+    query = filter_rounds(query, **filters)
+    if group_by is None:
+        return query.one()
+    return query.group_by(key).order_by(key).all()
+
+
+def played_years(user_id):
+    """Return the years of a user's first and last rounds, read from the ends of the date index.
+
+    Archived seasons come before the rounds left in the tour table.
+    """
+    archived = (db.session.query(func.min(SeasonSummary.season))
+                .filter(SeasonSummary.user_id == user_id).scalar_subquery())
+    first, last, first_archived = (db.session.query(func.min(Tour.date), func.max(Tour.date), archived)
+                                   .filter(Tour.user_id == user_id).one())
+    years = [d.year for d in (first, last) if d]
+    if first_archived:
+        years.append(first_archived)
+    return (min(years), max(years)) if years else None
+
+
+def period_key(period):
+    return func.strftime(PERIODS.get(period, PERIODS['month']), Tour.date)
+
+
+def diff_series(**filters):
+    query = filter_rounds(db.session.query(Score.diff).join(Tour, Score.tour_id == Tour.id), **filters)
+    return [d for (d,) in query.filter(Score.diff.is_not(None)).order_by(Score.id)]
+
+
+def hole_averages(**filters):
+    """Return per hole number the average strokes over par, putts and GIR percentage, then their counts."""
+    over_par = HoleResult.strokes - HoleResult.par
+    gir = cast(HoleResult.gir, Integer)
+    query = (
+        db.session.query(
+            HoleResult.hole_no,
+            func.avg(over_par),
+            func.avg(HoleResult.putts),
+            func.avg(gir) * 100,
+            func.count(over_par),
+            func.count(HoleResult.putts),
+            func.count(gir),
+        )
+        .join(Score, HoleResult.score_id == Score.id)
+        .join(Tour, Score.tour_id == Tour.id)
+    )
+    return filter_rounds(query, **filters).group_by(HoleResult.hole_no).order_by(HoleResult.hole_no).all()
+
+
+def putts_average(user_id):
+    """Return the average putts per hole over every card of a user, archived seasons included."""
+    archived = db.session.query(SeasonSummary).filter(SeasonSummary.user_id == user_id)
+    archived_putts = archived.with_entities(func.coalesce(func.sum(SeasonSummary.putts), 0)).scalar_subquery()
+    archived_cards = archived.with_entities(func.coalesce(func.sum(SeasonSummary.cards), 0)).scalar_subquery()
+    total, count = (
+        db.session.query(func.coalesce(func.sum(Stats.putts_total), 0) + archived_putts,
+                         func.count(Stats.id) + archived_cards)
+        .select_from(Stats)
+        .join(Score, Stats.score_id == Score.id)
+        .join(Tour, Score.tour_id == Tour.id)
+        .filter(Tour.user_id == user_id)
+        .one()
+    )
+    return total / (count * 18) if count else None
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+        self.parameters = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith('BEGIN'):
+            self.statements.append(statement)
+            self.parameters.append(parameters)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Record the SQL statements executed inside the block."""
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+
+
+@contextmanager
+def query_budget(limit, engine=None):
+    """Fail when the block executes more than `limit` SQL statements."""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError(
+            f'{counter.count} queries executed, budget is {limit}:\n' + '\n'.join(counter.statements)
+        )
+
+
+def unscoped_reads(statement, parameters=()):
+    """Return the EXPLAIN QUERY PLAN steps of a query that read rounds without an index on their owner."""
+    plan = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+    return [detail for *_, detail in plan if UNSCOPED_READ.match(detail)]
@@ -0,0 +1,127 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+
+def distribute_handicap(handicap, hcps):
+    if handicap is None:
+        handicap = 0
+    base = handicap // 18
+    extra = handicap % 18
+    dist = [base] * 18
+    for i, h in enumerate(hcps):
+        if h <= extra:
+            dist[i] += 1
+    return dist
+
+
+def diff_whs(sba_total, slope, sss, pcc=0):
+    diff = (113 / slope) * (sba_total - sss) - pcc
+    base = math.floor(diff * 10)
+    rounded = base / 10
+    centieme = int(abs(diff) * 100) % 10
+    if centieme > 5:
+        rounded += 0.1
+    return round(rounded, 1)
+
+
+@lru_cache(maxsize=4096)
+def allocation(handicap, hcps):
+    """Return distribute_handicap(handicap, hcps) as a tuple, memoized.
+
+    `hcps` must be a tuple; a player keeps the same handicap and courses for
+    many rounds, so most cards reuse an existing table.
+    """
+    return tuple(distribute_handicap(handicap, hcps))
+
+
+def differentials(sba_totals, slopes, ssses, pccs):
+    """Vectorized diff_whs: the differentials of many cards, with the same rounding."""
+    slopes = np.asarray(slopes, dtype=float)
+    diff = (113 / slopes) * (np.asarray(sba_totals, dtype=float) - np.asarray(ssses, dtype=float)) \
+        - np.asarray(pccs, dtype=float)
+    rounded = np.floor(diff * 10) / 10
+    centieme = np.trunc(np.abs(diff) * 100) % 10
+    return np.round(np.where(centieme > 5, rounded + 0.1, rounded), 1)
+
+
+def net_double_bogey(strokes, par, given):
+    """Cap a hole score at net double bogey (par + 2 + strokes received)."""
+    if strokes is None:
+        return None
+    return min(strokes, par + 2 + given)
+
+
+def score_cards(cards):
+    """Set strokes received and adjusted scores on many cards.
+
+    `cards` is a list of (holes, handicap, hcps) with 18 hole dicts each. An
+    `adjusted` value already present on a hole is kept as entered. Hole dicts
+    are filled directly from the memoized allocation tables: copying the
+    holes into NumPy arrays and back costs more than the loop.
+    """
+    for holes, handicap, hcps in cards:
+        for hole, given in zip(holes, allocation(handicap, tuple(hcps))):
+            hole['strokes_given'] = given
+            if hole.get('adjusted') is None:
+                hole['adjusted'] = net_double_bogey(hole['strokes'], hole['par'], given)
+    return cards
+
+
+def score_holes(holes, handicap, hcps):
+    """Set strokes received and adjusted scores on a list of 18 hole dicts."""
+    score_cards([(holes, handicap, hcps)])
+    return holes
+
+
+def rescore_cards(cards):
+    """Recompute the strokes received and adjusted scores of saved cards.
+
+    `cards` is a list of (holes, handicap, hcps, pars); `pars`, when given,
+    replaces the par of each hole. Adjusted scores that differ from the net
+    double bogey computed when the card was saved were entered by hand and
+    are kept.
+    """
+    for holes, _, _, pars in cards:
+        for i, hole in enumerate(holes):
+            automatic = hole['par'] is not None and hole['adjusted'] == net_double_bogey(
+                hole['strokes'], hole['par'], hole['strokes_given'] or 0)
+            if automatic:
+                hole['adjusted'] = None
+            if pars:
+                hole['par'] = pars[i]
+    return score_cards([(holes, handicap, hcps) for holes, handicap, hcps, _ in cards])
+
+
+def card_stats(holes):
+    """Return the Stats column values for a list of hole dicts."""
+    putts_total = sum(h['putts'] or 0 for h in holes)
+    return {
+        'fairway_hits': sum(1 for h in holes if h['par'] != 3 and h['fairway']),
+        'fairway_possible': sum(1 for h in holes if h['par'] != 3),
+        'gir_hits': sum(1 for h in holes if h['gir']),
+        'putts_total': putts_total,
+        'putts_avg': format(putts_total / 18, '.1f'),
+    }
+
+
+def update_totals(pairs):
+    """Store the gross total, SBA total and WHS differential on many (score, tour) pairs."""
+    rated = []
+    for score, tour in pairs:
+        score.total_strokes = sum(h.strokes or 0 for h in score.holes)
+        score.total_sba = sum(h.adjusted or 0 for h in score.holes)
+        score.diff = None
+        if tour and tour.slope and tour.sss is not None:
+            rated.append((score, tour))
+    if rated:
+        diffs = differentials([score.total_sba for score, _ in rated], [tour.slope for _, tour in rated],
+                              [tour.sss for _, tour in rated], [tour.pcc or 0 for _, tour in rated])
+        for (score, _), diff in zip(rated, diffs.tolist()):
+            score.diff = diff
+
+
+def update_score_totals(score, tour):
+    """Store the gross total, SBA total and WHS differential on a score."""
+    update_totals([(score, tour)])
@@ -0,0 +1,106 @@
+"""Full-text search over round names and golf courses with SQLite FTS5.
+
+The golf_search and tour_search tables index the golf and tour rows
+(external content, so the text is not stored twice) and are kept in sync
+by triggers, whichever code writes the rows: forms, API, importer or
+migrations. Words are matched by prefix, without accents or case.
+"""
+import re
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import selectinload
+
+from catalog import course_catalog
+from models import db, Tour
+
+TOKENIZE = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+# Indexed columns of each content table.
+SEARCH_TABLES = {
+    'golf_search': ('golf', ('name', 'course', 'tees')),
+    'tour_search': ('tour', ('name',)),
+}
+# bm25 weights: a word in the golf name counts more than in its course or tees.
+GOLF_WEIGHTS = (10.0, 5.0, 1.0)
+WORD = re.compile(r'\w+')
+
+
+def _schema(name, content, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    delete = f"INSERT INTO {name}({name}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    insert = f'INSERT INTO {name}(rowid, {cols}) VALUES (new.id, {new});'
+    return [
+        f"CREATE VIRTUAL TABLE {name} USING fts5({cols}, content = '{content}', content_rowid = 'id', {TOKENIZE})",
+        f'CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {content} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {content} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {cols} ON {content} BEGIN {delete} {insert} END',
+    ]
+
+
+def create_search_index(conn):
+    """Create the missing search tables and their triggers, filling new tables from their content."""
+    if conn.dialect.name != 'sqlite':
+        return
+    for name, (content, columns) in SEARCH_TABLES.items():
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {'name': name}).first()
+        create_table, *triggers = _schema(name, content, columns)
+        if not exists:
+            conn.execute(text(create_table))
+            conn.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+        for trigger in triggers:
+            conn.execute(text(trigger))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _after_create(metadata, conn, **kw):
+    create_search_index(conn)
+
+
+def rebuild_search_index():
+    """Re-read every golf and tour into the search tables, after writes that bypass the triggers."""
+    for name in SEARCH_TABLES:
+        db.session.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+    db.session.commit()
+
+
+def match_query(query):
+    """Return an FTS5 query matching every word of `query` by prefix, or None without words."""
+    words = WORD.findall(query or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_courses(query, limit=10, courses=None):
+    """Return the catalog courses matching `query`, best first.
+
+    `courses` is the catalog's courses by id, when the caller already has it.
+    """
+    match = match_query(query)
+    if not match:
+        return []
+    weights = ', '.join(str(w) for w in GOLF_WEIGHTS)
+    ids = db.session.execute(text(
+        f'SELECT rowid FROM golf_search WHERE golf_search MATCH :match '
+        f'ORDER BY bm25(golf_search, {weights}) LIMIT :limit'
+    ), {'match': match, 'limit': limit}).scalars().all()
+    courses = courses if courses is not None else course_catalog().by_id
+    return [courses[golf_id] for golf_id in ids if golf_id in courses]
+
+
+def search_tours(user_id, query, limit=20):
+    """Return a user's tours whose name matches `query`, best first, with their score loaded."""
+    match = match_query(query)
+    if not match:
+        return []
+    ids = db.session.execute(text(
+        'SELECT tour.id FROM tour_search JOIN tour ON tour.id = tour_search.rowid '
+        'WHERE tour_search MATCH :match AND tour.user_id = :user_id '
+        'ORDER BY tour_search.rank, tour.date DESC LIMIT :limit'
+    ), {'match': match, 'user_id': user_id, 'limit': limit}).scalars().all()
+    if not ids:
+        return []
+    tours = {t.id: t for t in Tour.query.filter(Tour.id.in_(ids)).options(selectinload(Tour.score))}
+    return [tours[tour_id] for tour_id in ids]
@@ -0,0 +1,38 @@
+// Type-ahead for the course pickers: an input with data-golf-search="<select id>"
+// replaces the options of the select with the courses matching what is typed.
+document.addEventListener('DOMContentLoaded', function(){
+    document.querySelectorAll('input[data-golf-search]').forEach(function(input){
+        const select = document.getElementById(input.dataset.golfSearch);
+        const allOptions = Array.from(select.options).map(o => o.cloneNode(true));
+        let timer = null;
+        let controller = null;
+
+        function showOptions(options){
+            const selected = select.value;
+            select.replaceChildren(allOptions[0].cloneNode(true), ...options);
+            if(Array.from(select.options).some(o => o.value === selected)){
+                select.value = selected;
+            } else if(options.length === 1){
+                select.value = options[0].value;
+                select.dispatchEvent(new Event('change'));
+            }
+        }
+
+        input.addEventListener('input', function(){
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if(!query){
+                showOptions(allOptions.slice(1).map(o => o.cloneNode(true)));
+                return;
+            }
+            timer = setTimeout(function(){
+                if(controller) controller.abort();
+                controller = new AbortController();
+                fetch(input.dataset.url + '?q=' + encodeURIComponent(query), {signal: controller.signal})
+                    .then(r => r.json())
+                    .then(data => showOptions(data.golfs.map(g => new Option(`${g.name} - ${g.course} (${g.tees})`, g.id))))
+                    .catch(() => {});
+            }, 150);
+        });
+    });
+});
@@ -0,0 +1,156 @@
+from sqlalchemy import func, insert
+
+from cache import bump_version
+from models import db, CourseSummary, HoleResult, Score, SeasonSummary, Tour
+
+
+def _scored_rounds(user_id, golf_ids):
+    query = (db.session.query(Tour.golf_id).join(Score, Score.tour_id == Tour.id)
+             .filter(Tour.user_id == user_id, Tour.golf_id.is_not(None)))
+    if golf_ids is not None:
+        query = query.filter(Tour.golf_id.in_(golf_ids))
+    return query
+
+
+def _lowest(*values):
+    values = [v for v in values if v is not None]
+    return min(values) if values else None
+
+
+def _mean(total, count, digits=None):
+    if not count:
+        return None
+    return round(total / count, digits) if digits is not None else total / count
+
+
+def _hole_means(holes, column):
+    if not any(sums[1] or sums[3] for sums in holes):
+        return None
+    return [_mean(sums[column], sums[column + 1], 2) for sums in holes]
+
+
+def refresh_course_summaries(user_id, golf_ids=None):
+    """Recompute a user's summaries for some golfs, or for all of them.
+
+    Only the rounds of the given golfs are read, through the user and golf
+    index of tours, so saving or deleting a card costs the rounds played on
+    that course rather than the whole history. The season summaries of the
+    archived rounds are added in. Pages then read one row per golf.
+    """
+    if user_id is None:
+        return
+    if golf_ids is not None:
+        golf_ids = {golf_id for golf_id in golf_ids if golf_id is not None}
+        if not golf_ids:
+            return
+    rounds = _scored_rounds(user_id, golf_ids)
+    totals = rounds.with_entities(
+        Tour.golf_id,
+        func.count(Score.id).label('rounds'),
+        func.min(Score.total_strokes).label('best_strokes'),
+        func.coalesce(func.sum(Score.total_strokes), 0).label('strokes'),
+        func.count(Score.total_strokes).label('strokes_count'),
+        func.min(Score.total_sba).label('best_sba'),
+        func.coalesce(func.sum(Score.total_sba), 0).label('sba'),
+        func.count(Score.total_sba).label('sba_count'),
+        func.min(Score.diff).label('best_diff'),
+        func.coalesce(func.sum(Score.diff), 0).label('diff'),
+        func.count(Score.diff).label('diff_count'),
+        func.max(Tour.date).label('last_played'),
+    ).group_by(Tour.golf_id).all()
+    # The best card is the lowest gross score, the earliest one on ties.
+    rank = func.row_number().over(partition_by=Tour.golf_id, order_by=(Score.total_strokes, Tour.date, Tour.id))
+    ranked = (rounds.with_entities(Tour.golf_id, Tour.id.label('tour_id'), rank.label('rank'))
+              .filter(Score.total_strokes.is_not(None)).subquery())
+    best_tours = dict(db.session.query(ranked.c.golf_id, ranked.c.tour_id).filter(ranked.c.rank == 1))
+    over_par = HoleResult.strokes - HoleResult.par
+    hole_rows = (rounds.with_entities(Tour.golf_id, HoleResult.hole_no,
+                                      func.coalesce(func.sum(over_par), 0), func.count(over_par),
+                                      func.coalesce(func.sum(HoleResult.putts), 0), func.count(HoleResult.putts))
+                 .join(HoleResult, HoleResult.score_id == Score.id)
+                 .group_by(Tour.golf_id, HoleResult.hole_no))
+    archived = SeasonSummary.query.filter_by(user_id=user_id)
+    if golf_ids is not None:
+        archived = archived.filter(SeasonSummary.golf_id.in_(golf_ids))
+
+    golfs = {
+        row.golf_id: {**row._asdict(), 'best_tour_id': best_tours.get(row.golf_id),
+                      'holes': [[0] * 4 for _ in range(18)]}
+        for row in totals
+    }
+    for golf_id, hole_no, *sums in hole_rows:
+        if 1 <= hole_no <= 18:
+            golfs[golf_id]['holes'][hole_no - 1] = sums
+    for summary in archived.order_by(SeasonSummary.season.desc()):
+        if summary.golf_id is None:
+            continue
+        golf = golfs.setdefault(summary.golf_id, {
+            'rounds': 0, 'best_strokes': None, 'strokes': 0, 'strokes_count': 0, 'best_sba': None, 'sba': 0,
+            'sba_count': 0, 'best_diff': None, 'diff': 0, 'diff_count': 0, 'last_played': None,
+            'best_tour_id': None, 'holes': [[0] * 4 for _ in range(18)],
+        })
+        # Archived seasons are older than the hot rounds and come latest
+        # first, so on ties the earliest season keeps the best card.
+        if summary.best_strokes is not None and (golf['best_strokes'] is None
+                                                 or summary.best_strokes <= golf['best_strokes']):
+            golf['best_tour_id'] = summary.best_tour_id
+        golf['rounds'] += summary.cards
+        golf['best_strokes'] = _lowest(golf['best_strokes'], summary.best_strokes)
+        golf['strokes'] += summary.strokes
+        golf['strokes_count'] += summary.cards
+        golf['best_sba'] = _lowest(golf['best_sba'], summary.best_sba)
+        golf['sba'] += summary.sba
+        golf['sba_count'] += summary.cards
+        golf['best_diff'] = _lowest(golf['best_diff'], summary.best_diff)
+        golf['diff'] += summary.diff_sum
+        golf['diff_count'] += summary.diff_count
+        golf['last_played'] = max((d for d in (golf['last_played'], summary.last_played) if d), default=None)
+        for total, sums in zip(golf['holes'], summary.holes or []):
+            for i in range(4):
+                total[i] += sums[i]
+
+    existing = CourseSummary.query.filter_by(user_id=user_id)
+    if golf_ids is not None:
+        existing = existing.filter(CourseSummary.golf_id.in_(golf_ids))
+    existing.delete()
+    entries = [
+        {
+            'user_id': user_id,
+            'golf_id': golf_id,
+            'rounds': golf['rounds'],
+            'best_strokes': golf['best_strokes'],
+            'avg_strokes': _mean(golf['strokes'], golf['strokes_count']),
+            'best_sba': golf['best_sba'],
+            'avg_sba': _mean(golf['sba'], golf['sba_count']),
+            'best_diff': golf['best_diff'],
+            'avg_diff': _mean(golf['diff'], golf['diff_count'], 1),
+            'best_tour_id': golf['best_tour_id'],
+            'last_played': golf['last_played'],
+            'hole_over_par': _hole_means(golf['holes'], 0),
+            'hole_putts': _hole_means(golf['holes'], 2),
+        }
+        for golf_id, golf in golfs.items()
+    ]
+    if entries:
+        db.session.execute(insert(CourseSummary.__table__), entries)
+    bump_version(user_id)
+    db.session.commit()
+
+
+def course_summary(user_id, golf_id):
+    """Return a user's summary for one golf, or None if they have no card there."""
+    return db.session.get(CourseSummary, (user_id, golf_id))
+
+
+def course_summaries(user_id):
+    """Return a user's summaries by golf id."""
+    return {s.golf_id: s for s in CourseSummary.query.filter_by(user_id=user_id)}
+
+
+def rebuild_all_course_summaries():
+    """Recompute the summaries of every user owning rounds, archived or not."""
+    user_ids = [uid for (uid,) in db.session.query(Tour.user_id).filter(Tour.user_id.is_not(None))
+                .union(db.session.query(SeasonSummary.user_id))]
+    for user_id in user_ids:
+        refresh_course_summaries(user_id)
+    return len(user_ids)
@@ -0,0 +1,95 @@
+"""Application on a temporary SQLite database seeded with benchmarks.datagen."""
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import archive
+from app import create_app
+from benchmarks import datagen
+from cache import bump_version, view_cache
+from catalog import course_catalog
+from config import Config
+from handicap import update_index_history
+from migrations import upgrade_database
+from models import db, Tour, User
+from summaries import refresh_course_summaries
+
+# More rounds than a page, fewer rounds than a page, and rounds without a date.
+USERNAMES = ('bench', 'few', 'undated')
+
+
+def undate_rounds(username):
+    """Remove the date of every third round, like the rounds migrated from TinyDB without one."""
+    user = User.query.filter_by(username=username).one()
+    for tour in Tour.query.filter(Tour.user_id == user.id, Tour.id % 3 == 0):
+        tour.date = None
+    db.session.flush()
+    update_index_history(user.id)
+    refresh_course_summaries(user.id)
+    bump_version(user.id)
+    db.session.commit()
+
+
+def make_app(path):
+    """Return the application on a new SQLite database file at `path`."""
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        ARCHIVE_PATH = None
+        VIEW_CACHE_PATH = None
+        JOB_THREADS = 0
+        WTF_CSRF_ENABLED = False
+
+    return create_app(TestConfig)
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    app = make_app(tmp_path_factory.mktemp('db') / 'app.db')
+    with app.app_context():
+        upgrade_database()
+        datagen.generate(300, username='bench', seed=1)
+        datagen.generate(12, username='few', seed=2)
+        datagen.generate(80, username='undated', seed=3)
+        undate_rounds('undated')
+        # The first seasons go to the archive file, which the pages then read too.
+        archive.open_archive()
+        archive.archive_rounds(datetime.date(2017, 1, 1))
+    return app
+
+
+@pytest.fixture(params=USERNAMES)
+def player(app, request):
+    """A test client logged in as a seeded user, with the ids of their latest round."""
+    view_cache.clear()
+    with app.app_context():
+        user = User.query.filter_by(username=request.param).one()
+        tour = Tour.query.filter_by(user_id=user.id).order_by(Tour.id.desc()).first()
+        # The course catalog is shared by every page and process: count pages with it loaded.
+        course_catalog()
+        ids = {'golf_id': tour.golf_id, 'tour_id': tour.id}
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.id)
+    return SimpleNamespace(client=client, ids=ids)
+
+
+@pytest.fixture
+def empty_app(tmp_path):
+    """An application context on an empty database of its own, for tests that write."""
+    app = make_app(tmp_path / 'app.db')
+    # The cached course catalog belongs to the other database.
+    view_cache.clear()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    view_cache.clear()
+
+
+@pytest.fixture
+def golfer(empty_app):
+    """A user without rounds, on an empty database with a few golfs."""
+    upgrade_database()
+    datagen.generate(0, golfs=3, username='ann')
+    return User.query.filter_by(username='ann').one()
@@ -0,0 +1,48 @@
+"""Random cards and the per-card reference scorer, shared by the scoring tests and benchmark."""
+import random
+
+from scoring import differentials, diff_whs, distribute_handicap, net_double_bogey, score_cards
+
+
+def make_cards(n, seed=0):
+    """Return random cards with the handicaps, courses and totals seen in real play."""
+    rng = random.Random(seed)
+    layouts = [(rng.choices((3, 4, 5), weights=(4, 10, 4), k=18), rng.sample(range(1, 19), 18)) for _ in range(20)]
+    cards = []
+    for _ in range(n):
+        pars, hcps = rng.choice(layouts)
+        handicap = rng.randint(-4, 54)
+        holes = [{'par': par, 'strokes': par + rng.randint(-1, 5), 'adjusted': None} for par in pars]
+        if rng.random() < 0.02:
+            holes[0]['strokes'] = None
+        cards.append({
+            'holes': holes,
+            'handicap': handicap,
+            'hcps': hcps,
+            'sba': rng.randint(60, 130),
+            'slope': rng.randint(55, 155),
+            'sss': round(rng.uniform(60, 78), 1),
+            'pcc': rng.randint(-1, 3),
+        })
+    return cards
+
+
+def copy_holes(cards):
+    return [[dict(h) for h in c['holes']] for c in cards]
+
+
+def python_scores(cards, holes):
+    """Reference results from the per-card functions, one card and one hole at a time."""
+    for c, card_holes in zip(cards, holes):
+        for hole, given in zip(card_holes, distribute_handicap(c['handicap'], c['hcps'])):
+            hole['strokes_given'] = given
+            hole['adjusted'] = net_double_bogey(hole['strokes'], hole['par'], given)
+    diffs = [diff_whs(c['sba'], c['slope'], c['sss'], c['pcc']) for c in cards]
+    return holes, diffs
+
+
+def batch_scores(cards, holes):
+    score_cards([(card_holes, c['handicap'], c['hcps']) for c, card_holes in zip(cards, holes)])
+    diffs = differentials([c['sba'] for c in cards], [c['slope'] for c in cards],
+                          [c['sss'] for c in cards], [c['pcc'] for c in cards]).tolist()
+    return holes, diffs
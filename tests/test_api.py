@@ -0,0 +1,23 @@
+"""JSON API."""
+import random
+
+from flask import current_app
+
+from benchmarks import datagen
+from models import Golf, Tour
+
+
+def test_api_reports_malformed_cards_by_index(golfer):
+    golfs = Golf.query.order_by(Golf.id).all()
+    valid = [card for _, card in datagen.make_cards(random.Random(2), golfs, 3)]
+    cards = [valid[0], dict(valid[0], hcps=5), valid[1], dict(valid[1], name={'a': 1}),
+             dict(valid[2], hcps=[1, 2]), valid[2]]
+    client = current_app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(golfer.id)
+    response = client.post('/api/v1/cards', json=cards)
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['imported'] == 3 and len(body['tour_ids']) == 3
+    assert [error['index'] for error in body['errors']] == [1, 3, 4]
+    assert Tour.query.filter_by(user_id=golfer.id).count() == 3
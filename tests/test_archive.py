@@ -0,0 +1,103 @@
+"""Moving old seasons to the archive file."""
+import datetime
+
+import pytest
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import IntegrityError
+
+import archive
+from benchmarks import datagen
+from migrations import AUTOINCREMENT_TABLES, upgrade_database
+from models import db, CourseSummary, Tour
+from summaries import refresh_course_summaries
+
+
+def table_sql(name):
+    return db.session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {'name': name}).scalar()
+
+
+def test_upgrade_keeps_archived_ids_from_being_reused(empty_app, monkeypatch):
+    # Tables created before the round ids were AUTOINCREMENT.
+    for table, _ in AUTOINCREMENT_TABLES:
+        monkeypatch.setitem(table.dialect_options['sqlite'], 'autoincrement', False)
+    db.create_all()
+    monkeypatch.undo()
+    datagen.generate(20, golfs=3, username='ann')
+    latest = Tour.query.order_by(Tour.id.desc()).first()
+    latest.date = datetime.date(2015, 6, 1)
+    latest_id = latest.id
+    db.session.commit()
+    archive.open_archive()
+    archive.archive_rounds(datetime.date(2016, 1, 1))
+    tops = {archived.name: db.session.execute(select(func.max(archived.c.id))).scalar()
+            for _, archived in AUTOINCREMENT_TABLES}
+    assert tops['tour'] == latest_id
+    # The upgrade writes through its own connection.
+    db.session.commit()
+
+    upgrade_database()
+    assert all('AUTOINCREMENT' in table_sql(table.name) for table, _ in AUTOINCREMENT_TABLES)
+    triggers = db.session.execute(text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+                                       "AND tbl_name = 'tour'")).scalar()
+    assert triggers == 3
+    tour_id, = datagen.generate(1, golfs=3, username='ann', seed=1).tour_ids
+    tour = db.session.get(Tour, tour_id)
+    assert tour.id > tops['tour']
+    assert tour.score.id > tops['score']
+    assert min(hole.id for hole in tour.score.holes) > tops['hole_result']
+    assert tour.score.stats.id > tops['stats']
+
+
+def test_archive_resumes_an_interrupted_run(empty_app):
+    upgrade_database()
+    datagen.generate(10, golfs=3, username='ann')
+    archive.open_archive()
+    # A run stopped after copying its first chunk, before removing it.
+    first = [tour.id for tour in Tour.query.order_by(Tour.date, Tour.id).limit(4)]
+    for table, archived, condition in archive._chunk_tables(first):
+        db.session.execute(insert(archived).from_select(list(table.c.keys()), select(table).where(condition)))
+    db.session.commit()
+
+    assert archive.archive_rounds(datetime.date(2030, 1, 1)) == 10
+    assert Tour.query.count() == 0
+    assert db.session.execute(select(func.count()).select_from(archive.archived_tours)).scalar() == 10
+    assert db.session.execute(select(func.count()).select_from(archive.archived_holes)).scalar() == 180
+
+
+def test_archive_does_not_overwrite_another_round(empty_app):
+    upgrade_database()
+    datagen.generate(5, golfs=3, username='ann')
+    archive.open_archive()
+    first = Tour.query.order_by(Tour.date, Tour.id).first()
+    db.session.execute(insert(archive.archived_tours).values(
+        id=first.id, user_id=first.user_id, name='Autre partie', date=datetime.date(2010, 5, 1)))
+    db.session.commit()
+
+    with pytest.raises(IntegrityError):
+        archive.archive_rounds(datetime.date(2030, 1, 1))
+    db.session.rollback()
+    assert Tour.query.count() == 5
+    assert db.session.execute(select(archive.archived_tours.c.name)).scalars().all() == ['Autre partie']
+
+
+def test_archiving_keeps_the_earliest_best_card_on_ties(golfer):
+    datagen.generate(40, golfs=3, username='ann')
+    golf_id = Tour.query.filter_by(user_id=golfer.id).first().golf_id
+    tied = Tour.query.filter_by(user_id=golfer.id, golf_id=golf_id).order_by(Tour.date).all()
+    tied = [tied[0], tied[len(tied) // 2], tied[-1]]
+    assert len({tour.date.year for tour in tied}) == 3
+    for tour in tied:
+        tour.score.total_strokes = 50
+    db.session.commit()
+    refresh_course_summaries(golfer.id)
+    before = {s.golf_id: s.best_tour_id for s in CourseSummary.query.filter_by(user_id=golfer.id)}
+    assert before[golf_id] == tied[0].id
+
+    # The first two tied cards go to the archive, in different seasons; the last one stays.
+    cutoff = datetime.date(tied[-1].date.year, 1, 1)
+    archive.open_archive()
+    archive.archive_rounds(cutoff)
+    # As the next card saved on any golf does, read the archived seasons back.
+    refresh_course_summaries(golfer.id)
+    assert {s.golf_id: s.best_tour_id for s in CourseSummary.query.filter_by(user_id=golfer.id)} == before
@@ -0,0 +1,51 @@
+"""Import of card files."""
+import io
+import random
+
+import pytest
+
+import importer
+from benchmarks import datagen
+from models import Golf, Tour
+
+UNREADABLE_FILES = [
+    ('cartes.csv', 'name,date,golf_id\nPartie d’été,01/06/2024,1\n'.encode('cp1252'), 'encodé en UTF-8'),
+    ('cartes.json', b'[{"name": "Partie 1", "golf_id": 1', 'JSON invalide ligne 1'),
+]
+
+
+@pytest.mark.parametrize('filename, content, message', UNREADABLE_FILES)
+def test_import_page_reports_unreadable_file(player, filename, content, message):
+    response = player.client.post('/import', data={'file': (io.BytesIO(content), filename)})
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert '0 carte(s) importée(s)' in page
+    assert message in page
+
+
+@pytest.mark.parametrize('filename, content, message', UNREADABLE_FILES)
+def test_import_command_reports_unreadable_file(app, tmp_path, filename, content, message):
+    path = tmp_path / filename
+    path.write_bytes(content)
+    result = app.test_cli_runner().invoke(args=['import-cards', str(path), '--user', 'few'])
+    assert result.exit_code == 1
+    assert message in result.output
+
+
+def malformed_cards(seed):
+    """Return three valid cards, each followed by a malformed copy: bad hcps, short hcps, non-string name."""
+    golfs = Golf.query.order_by(Golf.id).all()
+    cards = [card for _, card in datagen.make_cards(random.Random(seed), golfs, 3)]
+    bad = [dict(cards[0], hcps=5), dict(cards[1], hcps=[1, 2]), dict(cards[2], name={'a': 1})]
+    return [card for pair in zip(cards, bad) for card in pair]
+
+
+def test_import_skips_malformed_cards_of_a_chunk(golfer):
+    report = importer.import_cards(enumerate(malformed_cards(1), start=1), golfer.id)
+    assert report.imported == 3
+    assert [row_no for row_no, _ in report.errors] == [2, 4, 6]
+    assert [message for _, message in report.errors] == [
+        'hcps doit être une liste de 18 valeurs', 'hcps doit être une liste de 18 valeurs', "name invalide : {'a': 1}",
+    ]
+    assert Tour.query.filter_by(user_id=golfer.id).count() == 3
+
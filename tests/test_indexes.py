@@ -0,0 +1,55 @@
+"""Page queries read the user's rounds through an index."""
+import pytest
+
+import queries
+
+# Pages whose queries must only read the user's rows through an index.
+INDEX_CHECK_URLS = [
+    '/',
+    '/?season=2024',
+    '/scores',
+    '/scores?sort=diff',
+    '/scores?season=2024&from=2024-04-01',
+    '/scores?sort=diff&golf={golf_id}&season=2024',
+    '/scores?golf={golf_id}',
+    '/stats',
+    '/stats?period=year',
+    '/stats?golf={golf_id}&from=2000-01-01&to=2100-12-31',
+    '/analytics',
+    '/analytics?golf={golf_id}',
+    '/analytics.json',
+    '/export/csv',
+    '/export/csv?golf={golf_id}',
+    '/export/holes',
+    '/export/jsonl',
+    '/export/jsonl?season=2024',
+    '/golf',
+    '/golf/{golf_id}',
+    '/golfs.json',
+    '/golfs/search.json?q=go',
+    '/search?q=t',
+    '/view_score/{tour_id}',
+    '/add_score/{tour_id}',
+    '/add_tour',
+    '/add_tour?id={tour_id}',
+    '/start_score',
+    '/api/v1/golfs',
+    '/api/v1/tours',
+    '/api/v1/tours?fields=id,date,diff',
+    '/api/v1/tours/{tour_id}',
+]
+
+
+@pytest.mark.parametrize('url', INDEX_CHECK_URLS)
+def test_page_reads_rounds_through_an_index(app, player, url):
+    with app.app_context():
+        with queries.count_queries() as counter:
+            response = player.client.get(url.format(**player.ids))
+            response.get_data()
+        assert response.status_code == 200
+        scans = {
+            statement: queries.unscoped_reads(statement, parameters)
+            for statement, parameters in zip(counter.statements, counter.parameters)
+            if statement.lstrip().startswith('SELECT')
+        }
+    assert not {statement: steps for statement, steps in scans.items() if steps}
@@ -0,0 +1,58 @@
+"""Database upgrades and the TinyDB migration."""
+import json
+
+from migrations import migrate_from_tinydb, upgrade_database
+from models import db, CourseSummary, IndexHistory, Tour, User
+
+
+def write_tinydb(path, rounds=5):
+    """Write a TinyDB file with one golf and `rounds` scored tours, as the previous version stored them."""
+    holes = [{'par': 4, 'strokes': 5, 'adjusted': None, 'fairway': True, 'gir': False, 'putts': 2}] * 18
+    data = {
+        'golfs': {'1': {'name': 'Golf 1', 'course': 'A', 'par': 72, 'slope': 125, 'sss': 71.5, 'tees': 'Jaunes',
+                        'pars': [4] * 18, 'hcps': list(range(1, 19))}},
+        'tours': {str(i): {'name': f'Partie {i}', 'jour': 1, 'date': f'2020-05-{i:02d}', 'golf_id': 1, 'par': 72,
+                           'slope': 125, 'sss': 71.5, 'pcc': 0, 'pars': [4] * 18, 'hcps': list(range(1, 19))}
+                  for i in range(1, rounds + 1)},
+        'scores': {str(i): {'tour_id': i, 'handicap': 18, 'holes': holes} for i in range(1, rounds + 1)},
+        'stats': {},
+    }
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return path
+
+
+def test_upgrade_releases_the_database_lock(empty_app):
+    upgrade_database()
+    with db.engine.begin() as conn:
+        conn.execute(db.text("INSERT INTO user (username) VALUES ('ann')"))
+    assert User.query.count() == 1
+
+
+def test_tinydb_rounds_go_to_the_only_user(empty_app, tmp_path):
+    upgrade_database()
+    user = User(username='ann')
+    db.session.add(user)
+    db.session.flush()
+    user_id = user.id
+    db.session.commit()
+
+    migrate_from_tinydb(str(write_tinydb(tmp_path / 'db.json')))
+    assert Tour.query.filter_by(user_id=user_id).count() == 5
+    assert IndexHistory.query.filter_by(user_id=user_id).count() == 5
+    assert CourseSummary.query.filter_by(user_id=user_id).one().rounds == 5
+
+
+def test_tinydb_rounds_wait_for_assign_tours_with_several_users(empty_app, tmp_path):
+    upgrade_database()
+    db.session.add_all([User(username='ann'), User(username='bob')])
+    db.session.commit()
+    path = write_tinydb(tmp_path / 'db.json')
+
+    result = empty_app.test_cli_runner().invoke(args=['migrate-tinydb', str(path)])
+    assert '5 tours sans propriétaire' in result.output
+    assert Tour.query.filter(Tour.user_id.is_(None)).count() == 5
+    # The command writes through its own session.
+    db.session.commit()
+    result = empty_app.test_cli_runner().invoke(args=['assign-tours', 'bob'])
+    assert '5 tours attribués à bob' in result.output
+    assert CourseSummary.query.one().rounds == 5
@@ -0,0 +1,48 @@
+"""Number of SQL queries run by the main pages."""
+import pytest
+
+import queries
+
+QUERY_BUDGETS = {
+    '/': 8,
+    '/scores': 5,
+    '/scores?sort=diff': 5,
+    '/stats': 11,
+    '/stats?period=year': 11,
+    '/analytics': 4,
+    '/analytics.json': 3,
+    # Exports also read the attached archive: its cards, then their holes.
+    '/export/csv': 3,
+    '/export/holes': 4,
+    '/export/jsonl': 4,
+    '/golf': 4,
+    '/golf/{golf_id}': 3,
+    '/golfs.json': 2,
+    '/golfs/search.json?q=go': 3,
+    '/search?q=t': 6,
+    '/add_tour': 2,
+    '/start_score': 2,
+    '/api/v1/golfs': 2,
+    '/api/v1/tours': 4,
+    '/api/v1/tours?fields=id,date,diff': 3,
+}
+# Repeat views of cached pages only load the user and the data version.
+CACHED_BUDGET = 2
+CACHED_PAGES = ('/', '/scores', '/stats')
+
+
+@pytest.mark.parametrize('url', QUERY_BUDGETS)
+def test_page_query_budget(app, player, url):
+    with app.app_context(), queries.query_budget(QUERY_BUDGETS[url]):
+        response = player.client.get(url.format(**player.ids))
+        # Exports are streamed: their queries run while the body is read.
+        response.get_data()
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('url', CACHED_PAGES)
+def test_cached_page_query_budget(app, player, url):
+    player.client.get(url)
+    with app.app_context(), queries.query_budget(CACHED_BUDGET):
+        response = player.client.get(url)
+    assert response.status_code == 200
@@ -0,0 +1,32 @@
+"""The batch scoring functions give exactly the results of the per-card ones."""
+import numpy as np
+
+from tests.scoring_cards import batch_scores, copy_holes, make_cards, python_scores
+from scoring import allocation, diff_whs, differentials, net_double_bogey, rescore_cards
+
+
+def test_score_cards_matches_per_card_functions():
+    cards = make_cards(5000)
+    expected = python_scores(cards, copy_holes(cards))
+    allocation.cache_clear()
+    assert batch_scores(cards, copy_holes(cards)) == expected
+
+
+def test_differentials_round_like_diff_whs():
+    # Every total, slope and SSS of real play, so each edge of a tenth is reached.
+    sba = np.arange(60, 131)
+    for slope in range(55, 156):
+        for sss in np.arange(600, 781) / 10:
+            exact = [diff_whs(int(s), slope, float(sss), 1) for s in sba]
+            assert differentials(sba, [slope] * len(sba), [sss] * len(sba), [1] * len(sba)).tolist() == exact, \
+                (slope, sss)
+
+
+def test_rescore_keeps_adjusted_scores_entered_by_hand():
+    holes = [{'par': 4, 'strokes': 9, 'adjusted': None, 'strokes_given': 0} for _ in range(18)]
+    rescore_cards([(holes, 18, list(range(1, 19)), None)])
+    assert [h['adjusted'] for h in holes] == [net_double_bogey(9, 4, 1)] * 18
+    holes[0]['adjusted'] = 8
+    rescore_cards([(holes, 0, list(range(1, 19)), [5] * 18)])
+    assert holes[0]['adjusted'] == 8
+    assert holes[1]['adjusted'] == net_double_bogey(9, 5, 0)
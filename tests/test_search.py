@@ -0,0 +1,8 @@
+"""Course type-ahead."""
+import pytest
+
+
+@pytest.mark.parametrize('limit, found', [(-1, 1), (0, 1), (3, 3), (1000, 20)])
+def test_course_search_clamps_limit(player, limit, found):
+    response = player.client.get(f'/golfs/search.json?q=golf&limit={limit}')
+    assert len(response.get_json()['golfs']) == found
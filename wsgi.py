@@ -0,0 +1,10 @@
+"""WSGI entry point for production servers, for example:
+
+    gunicorn --workers 4 wsgi:app
+
+Run `flask --app app upgrade-db` before starting the workers.
+"""
+from app import create_app
+from config import ProductionConfig
+
+app = create_app(ProductionConfig)